@@ -1,3 +1,4 @@
+import asyncio
 import glob
 import os
 import re
@@ -344,7 +345,7 @@ def _cleanup_selected_photos_with_gemini(
 
     try:
         # Import here to avoid raising at module import if deps not installed
-        from image_editor import cleanup_image, DEFAULT_GEMINI_MODEL  # type: ignore
+        from image_editor import cleanup_image_async, DEFAULT_GEMINI_MODEL  # type: ignore
     except Exception as e:
         # Cleanup unavailable; return originals
         meta["failures"].append(f"cleanup unavailable: {e}")
@@ -354,10 +355,10 @@ def _cleanup_selected_photos_with_gemini(
     meta["enabled"] = True
     meta["model"] = os.environ.get("GEMINI_IMAGE_MODEL", "gemini-2.5-flash-image-preview")
 
-    cleaned_paths: list[Path] = []
-    for p in selected_photos:
-        try:
-            res = cleanup_image(
+    async def _cleanup_all():
+        # Photos are independent: overlap the Gemini round-trips instead of running them back to back
+        return await asyncio.gather(*[
+            cleanup_image_async(
                 input_path=str(p),
                 # keep under uploads/cleaned so /photos/<path> can serve it
                 output_dir=os.path.join(app.config["UPLOAD_FOLDER"], "cleaned"),
@@ -365,11 +366,17 @@ def _cleanup_selected_photos_with_gemini(
                 model_name=meta["model"],
                 provider="gemini",
             )
-            cleaned_paths.append(Path(res.output_path))
-        except Exception as e:
+            for p in selected_photos
+        ], return_exceptions=True)
+
+    cleaned_paths: list[Path] = []
+    for p, res in zip(selected_photos, asyncio.run(_cleanup_all())):
+        if isinstance(res, BaseException):
             # Per-file fallback: use original; record reason
-            meta["failures"].append(f"{os.path.basename(p)}: {e}")
+            meta["failures"].append(f"{os.path.basename(p)}: {res}")
             cleaned_paths.append(p)
+        else:
+            cleaned_paths.append(Path(res.output_path))
 
     return cleaned_paths, meta
 
@@ -1,6 +1,7 @@
+import asyncio
+import functools
+import mimetypes
 import os
-import base64
-import uuid
 from dataclasses import dataclass
 from pathlib import Path
 from typing import Optional, Dict, Any, Tuple
@@ -12,6 +13,12 @@ try:
 except Exception:
     google_genai = None  # type: ignore
 
+# Optional SIMD base64 decoder for the (multi-MB) inline image payloads
+try:
+    from pybase64 import b64decode as _b64decode  # type: ignore
+except Exception:
+    from base64 import b64decode as _b64decode
+
 from PIL import Image as PILImage  # type: ignore
 
 
@@ -23,56 +30,7 @@ GENERAL_CLEANUP_PROMPT = (
 )
 
 
-_vertex_initialized = False
-
-
-def _ensure_vertex_initialized(project: Optional[str] = None, location: Optional[str] = None) -> None:
-    global _vertex_initialized
-    if _vertex_initialized:
-        return
-    if vertexai is None:
-        raise ImportError(
-            f"google-cloud-aiplatform not available: {_IMPORT_ERROR}. Install and retry."
-        )
-    project_to_use = project or DEFAULT_PROJECT
-    if not project_to_use:
-        raise EnvironmentError(
-            "Missing GCP project. Set GCP_PROJECT or GOOGLE_CLOUD_PROJECT environment variable."
-        )
-    location_to_use = location or DEFAULT_LOCATION
-    vertexai.init(project=project_to_use, location=location_to_use)
-    _vertex_initialized = True
-
-
-def _get_model(model_name: Optional[str] = None) -> Any:
-    _ensure_vertex_initialized()
-    # Try provided name, then sensible defaults/fallbacks
-    candidates = [
-        model_name,
-        DEFAULT_MODEL_NAME,
-        "imagen-4.0-edit-001",
-        "imagen-4.0-generate-001",
-        "imagegeneration@002",
-    ]
-    last_error: Optional[Exception] = None
-    for name in candidates:
-        if not name:
-            continue
-        try:
-            return ImageGenerationModel.from_pretrained(name)
-        except Exception as e:  # pragma: no cover - depends on environment availability
-            last_error = e
-            continue
-    raise RuntimeError(
-        f"Failed to load an Imagen model from candidates {candidates}. Last error: {last_error}"
-    )
-
-
-def _should_use_gemini(explicit_provider: Optional[str]) -> bool:
-    return True
-
-
-def _gemini_client() -> Any:
+def _gemini_client(shared: bool = True) -> Any:
     if google_genai is None:
         raise ImportError(
             "google-genai not installed. Add google-genai to requirements.txt and install."
@@ -82,57 +40,117 @@ def _gemini_client() -> Any:
         raise EnvironmentError(
             "Missing Gemini API key. Set NANO_BANANA_KEY or GEMINI_API_KEY."
         )
+    if not shared:
+        return google_genai.Client(api_key=api_key)
+    return _shared_gemini_client(api_key)
+
+
+@functools.lru_cache(maxsize=1)
+def _shared_gemini_client(api_key: str) -> Any:
+    # One client (and connection pool) per key, reused across edits
     return google_genai.Client(api_key=api_key)
 
 
+def _sniff_image_suffixes(data: bytes) -> Tuple[str, ...]:
+    # File suffixes matching the encoded format of data, from its magic bytes
+    if data.startswith(b"\x89PNG\r\n\x1a\n"):
+        return (".png",)
+    if data.startswith(b"\xff\xd8\xff"):
+        return (".jpg", ".jpeg")
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return (".webp",)
+    return ()
+
+
+_SUFFIX_MIMES = {".png": "image/png", ".jpg": "image/jpeg", ".webp": "image/webp"}
+# Formats Gemini takes as inline_data as-is; anything else goes through PIL
+_GEMINI_INLINE_MIMES = frozenset({"image/png", "image/jpeg", "image/webp", "image/heic", "image/heif"})
+# Opaque PNGs above this size are sent as JPEG: a fraction of the upload, same image to the model
+_PNG_TO_JPEG_BYTES = 2 * 1024 * 1024
+
+
+def _to_png_bytes(data: bytes) -> bytes:
+    buf = BytesIO()
+    with PILImage.open(BytesIO(data)) as img:
+        img.save(buf, format="PNG")
+    return buf.getvalue()
+
+
+def _opaque_png_to_jpeg(data: bytes) -> Optional[bytes]:
+    # None when the PNG has transparency that JPEG would lose
+    with PILImage.open(BytesIO(data)) as img:
+        if "transparency" in img.info:
+            return None
+        if img.mode in ("RGBA", "LA") and img.getchannel("A").getextrema()[0] < 255:
+            return None
+        buf = BytesIO()
+        img.convert("RGB").save(buf, format="JPEG", quality=92)
+    return buf.getvalue()
+
+
+@functools.lru_cache(maxsize=8)
+def _load_inline_image(path: str, mtime_ns: int, size: int) -> Tuple[bytes, str]:
+    # (bytes, mime) ready for Gemini inline_data, converted at most once per file version;
+    # mtime/size are part of the key so an overwritten upload is re-read
+    data = Path(path).read_bytes()
+    suffixes = _sniff_image_suffixes(data)
+    mime = _SUFFIX_MIMES[suffixes[0]] if suffixes else mimetypes.guess_type(path)[0] or "application/octet-stream"
+    if mime not in _GEMINI_INLINE_MIMES:
+        # Gemini won't take this format inline
+        return _to_png_bytes(data), "image/png"
+    if mime == "image/png" and len(data) > _PNG_TO_JPEG_BYTES:
+        jpeg = _opaque_png_to_jpeg(data)
+        if jpeg is not None and len(jpeg) < len(data):
+            return jpeg, "image/jpeg"
+    return data, mime
+
+
+def _read_image_bytes_and_mime(path: str) -> Tuple[bytes, str]:
+    st = os.stat(path)
+    return _load_inline_image(os.path.realpath(path), st.st_mtime_ns, st.st_size)
+
+
 def _save_image_bytes_to_file(data: bytes, output_path: Path) -> str:
     output_path.parent.mkdir(parents=True, exist_ok=True)
+    if output_path.suffix.lower() in _sniff_image_suffixes(data):
+        # Already encoded in the target format: write as-is instead of decoding and re-encoding
+        output_path.write_bytes(data)
+        return str(output_path)
     img = PILImage.open(BytesIO(data))
     img.save(output_path)
     return str(output_path)
 
 
+@functools.lru_cache(maxsize=8)
 def _normalize_gemini_model_name(name: Optional[str]) -> str:
     n = (name or DEFAULT_GEMINI_MODEL).strip()
     return n
 
 
-def _gemini_generate_image_bytes(
+def _gemini_request(
     prompt: str,
     base_image_path: Optional[str] = None,
-    mask_path: Optional[str] = None,  # ignored
     model_name: Optional[str] = None,
-) -> bytes:
-    client = _gemini_client()
+    shared_client: bool = True,
+) -> Tuple[Any, str, list]:
+    # (client, model, contents) shared by the sync and async generate calls
+    client = _gemini_client(shared=shared_client)
     model = _normalize_gemini_model_name(
         model_name or os.environ.get("GEMINI_IMAGE_MODEL") or "gemini-2.5-flash-image-preview"
     )
 
     contents: list[Any] = [prompt]
-    img_handle = None
     if base_image_path:
         try:
-            if PILImage is not None:
-                img_handle = PILImage.open(base_image_path)
-                img_handle.load()
-                contents.append(img_handle)
-            else:
-                img_bytes, mime = _read_image_bytes_and_mime(base_image_path)
-                contents.append({"inline_data": {"mime_type": mime, "data": img_bytes}})
+            img_bytes, mime = _read_image_bytes_and_mime(base_image_path)
+            # Ship the bytes as-is: no decode here, and no re-encode in the SDK
+            contents.append({"inline_data": {"mime_type": mime, "data": img_bytes}})
         except Exception as e:
             raise RuntimeError(f"Failed to read base image: {e}")
+    return client, model, contents
 
-    try:
-        resp = client.models.generate_content(model=model, contents=contents)
-    except Exception as e:
-        raise RuntimeError(f"Gemini generate_content failed: {e}")
-    finally:
-        if img_handle is not None:
-            try:
-                img_handle.close()
-            except Exception:
-                pass
 
+def _image_bytes_from_response(resp: Any) -> bytes:
     for cand in getattr(resp, "candidates", []) or []:
         content = getattr(cand, "content", None)
         if not content:
@@ -146,12 +164,45 @@ def _gemini_generate_image_bytes(
                     return data
                 if isinstance(data, str):
                     try:
-                        return base64.b64decode(data)
+                        return _b64decode(data, validate=False)
                     except Exception:
                         continue
     raise RuntimeError("Gemini did not return an image in inline_data.")
 
 
+def _gemini_generate_image_bytes(
+    prompt: str,
+    base_image_path: Optional[str] = None,
+    mask_path: Optional[str] = None,  # ignored
+    model_name: Optional[str] = None,
+) -> bytes:
+    client, model, contents = _gemini_request(prompt, base_image_path, model_name)
+    try:
+        resp = client.models.generate_content(model=model, contents=contents)
+    except Exception as e:
+        raise RuntimeError(f"Gemini generate_content failed: {e}")
+    return _image_bytes_from_response(resp)
+
+
+async def _gemini_generate_image_bytes_async(
+    prompt: str,
+    base_image_path: Optional[str] = None,
+    mask_path: Optional[str] = None,  # ignored
+    model_name: Optional[str] = None,
+) -> bytes:
+    # Reading/transcoding the base image is blocking file work; keep it off the event loop.
+    # Fresh client: its async HTTP session belongs to this event loop, and batch callers
+    # start a new loop per asyncio.run
+    client, model, contents = await asyncio.to_thread(
+        _gemini_request, prompt, base_image_path, model_name, False
+    )
+    try:
+        resp = await client.aio.models.generate_content(model=model, contents=contents)
+    except Exception as e:
+        raise RuntimeError(f"Gemini generate_content failed: {e}")
+    return _image_bytes_from_response(resp)
+
+
 @dataclass
 class EditResult:
     input_path: str
@@ -161,16 +212,13 @@ class EditResult:
     seed: Optional[int]
 
 
-def _save_vertex_image(img_obj: Any, output_path: Path) -> str:
-    output_path.parent.mkdir(parents=True, exist_ok=True)
-    # Vertex Image object exposes save() and/or .as_bytes()
-    if hasattr(img_obj, "save"):
-        img_obj.save(str(output_path))
-    else:
-        data = img_obj.as_bytes() if hasattr(img_obj, "as_bytes") else bytes(img_obj)
-        with open(output_path, "wb") as f:
-            f.write(data)
-    return str(output_path)
+def _output_path(input_path: str, output_dir: Optional[str], subdir: str, tag: str) -> Path:
+    # <output_dir or sibling subdir>/<stem>_<tag>_<rand><suffix>
+    base_dir, base_name = os.path.split(input_path)
+    stem, ext = os.path.splitext(base_name)
+    if output_dir is None:
+        output_dir = os.path.join(base_dir, subdir)
+    return Path(output_dir, f"{stem}_{tag}_{os.urandom(4).hex()}{ext}")
 
 
 def cleanup_image(
@@ -199,12 +247,8 @@ def cleanup_image(
     instruction = prompt or GENERAL_CLEANUP_PROMPT
 
     input_path_obj = Path(input_path)
-    if output_dir is None:
-        # Default next to uploads in a "cleaned" subdir
-        output_dir = str(input_path_obj.parent / "cleaned")
-    output_dir_path = Path(output_dir)
-    output_filename = f"{input_path_obj.stem}_cleaned_{uuid.uuid4().hex[:8]}{input_path_obj.suffix}"
-    output_path = output_dir_path / output_filename
+    # Default next to uploads in a "cleaned" subdir
+    output_path = _output_path(input_path, output_dir, "cleaned", "cleaned")
 
     image_bytes = _gemini_generate_image_bytes(
         prompt=instruction,
@@ -246,11 +290,7 @@ def edit_image_with_prompt(
     if not prompt or not prompt.strip():
         raise ValueError("Prompt must be a non-empty string.")
     input_path_obj = Path(input_path)
-    if output_dir is None:
-        output_dir = str(input_path_obj.parent / "edited")
-    output_dir_path = Path(output_dir)
-    output_filename = f"{input_path_obj.stem}_edit_{uuid.uuid4().hex[:8]}{input_path_obj.suffix}"
-    output_path = output_dir_path / output_filename
+    output_path = _output_path(input_path, output_dir, "edited", "edit")
 
     image_bytes = _gemini_generate_image_bytes(
         prompt=prompt,
@@ -267,3 +307,64 @@ def edit_image_with_prompt(
     )
 
 
+async def cleanup_image_async(
+    input_path: str,
+    output_dir: Optional[str] = None,
+    prompt: Optional[str] = None,
+    model_name: Optional[str] = None,
+    seed: Optional[int] = None,
+    negative_prompt: Optional[str] = None,
+    provider: Optional[str] = None,
+) -> EditResult:
+    """
+    Async cleanup_image: batch callers can asyncio.gather several of these so the
+    Gemini round-trips overlap instead of running back to back.
+    """
+    instruction = prompt or GENERAL_CLEANUP_PROMPT
+    input_path_obj = Path(input_path)
+    output_path = _output_path(input_path, output_dir, "cleaned", "cleaned")
+
+    image_bytes = await _gemini_generate_image_bytes_async(
+        prompt=instruction,
+        base_image_path=input_path,
+        model_name=model_name,
+    )
+    saved_path = await asyncio.to_thread(_save_image_bytes_to_file, image_bytes, output_path)
+    return EditResult(
+        input_path=str(input_path_obj),
+        output_path=saved_path,
+        prompt=instruction,
+        model_name=model_name or DEFAULT_GEMINI_MODEL,
+        seed=seed,
+    )
+
+
+async def edit_image_with_prompt_async(
+    input_path: str,
+    prompt: str,
+    mask_path: Optional[str] = None,
+    output_dir: Optional[str] = None,
+    model_name: Optional[str] = None,
+    seed: Optional[int] = None,
+    negative_prompt: Optional[str] = None,
+    provider: Optional[str] = None,
+) -> EditResult:
+    """Async edit_image_with_prompt, for gathering several edits concurrently."""
+    if not prompt or not prompt.strip():
+        raise ValueError("Prompt must be a non-empty string.")
+    input_path_obj = Path(input_path)
+    output_path = _output_path(input_path, output_dir, "edited", "edit")
+
+    image_bytes = await _gemini_generate_image_bytes_async(
+        prompt=prompt,
+        base_image_path=input_path,
+        model_name=model_name,
+    )
+    saved_path = await asyncio.to_thread(_save_image_bytes_to_file, image_bytes, output_path)
+    return EditResult(
+        input_path=str(input_path_obj),
+        output_path=saved_path,
+        prompt=prompt,
+        model_name=model_name or DEFAULT_GEMINI_MODEL,
+        seed=seed,
+    )
@@ -1,13 +1,46 @@
+import atexit
+import functools
 import os
+import random
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from typing import Dict, Any, List, Optional, Tuple
 
 import httpx
 
 
 API_VERSION = os.getenv("API_VERSION", "v23.0")
-
-
+_GRAPH_BASE = f"https://graph.facebook.com/{API_VERSION}"
+
+# HTTP/2 needs the optional h2 package; fall back to HTTP/1.1 keep-alive without it
+try:
+    import h2  # type: ignore  # noqa: F401
+    _HTTP2 = True
+except Exception:
+    _HTTP2 = False
+
+_CLIENT: Optional[httpx.Client] = None
+_CLIENT_LOCK = threading.Lock()
+
+
+def _get_client() -> httpx.Client:
+    """Shared Graph API client so publishes reuse one pooled TLS connection."""
+    global _CLIENT
+    if _CLIENT is None:
+        with _CLIENT_LOCK:
+            if _CLIENT is None:
+                _CLIENT = httpx.Client(
+                    timeout=60,
+                    follow_redirects=True,
+                    http2=_HTTP2,
+                    limits=httpx.Limits(max_keepalive_connections=10),
+                )
+                atexit.register(_CLIENT.close)
+    return _CLIENT
+
+
+@functools.lru_cache(maxsize=None)
 def _need(name: str) -> str:
     v = os.getenv(name)
     if not v or v == "PASTE_YOUR_PAGE_TOKEN":
@@ -25,12 +58,13 @@ def _api_ok(resp: httpx.Response, ctx: str) -> Dict[str, Any]:
 
 
 def _wait_ready(client: httpx.Client, container_id: str, page_token: str,
-                timeout_s: int = 300, poll_s: int = 5) -> None:
-    """Poll a media container until status_code == FINISHED."""
-    url = f"https://graph.facebook.com/{API_VERSION}/{container_id}"
+                timeout_s: int = 300, initial_poll_s: float = 1.0, max_poll_s: float = 8.0) -> None:
+    """Poll a media container until status_code == FINISHED (exponential backoff with jitter)."""
+    url = f"{_GRAPH_BASE}/{container_id}"
     params = {"fields": "status_code,status", "access_token": page_token}
     start = time.time()
     last = None
+    attempt = 0
     while True:
         r = client.get(url, params=params)
         j = _api_ok(r, "Check container status failed")
@@ -45,7 +79,8 @@ def _wait_ready(client: httpx.Client, container_id: str, page_token: str,
             raise RuntimeError(f"Container processing failed: {j}")
         if time.time() - start > timeout_s:
             raise TimeoutError(f"Timed out waiting for container to be ready (last={j})")
-        time.sleep(poll_s)
+        time.sleep(min(initial_poll_s * 2 ** attempt, max_poll_s) + random.uniform(0, 0.5))
+        attempt += 1
 
 
 def publish_single(*, is_story: bool, media_kind: str, url: str, caption: Optional[str] = None) -> Dict[str, Any]:
@@ -53,7 +88,7 @@ def publish_single(*, is_story: bool, media_kind: str, url: str, caption: Option
     ig_user_id = _need("IG_USER_ID")
     page_token = _need("PAGE_TOKEN")
 
-    create_url = f"https://graph.facebook.com/{API_VERSION}/{ig_user_id}/media"
+    create_url = f"{_GRAPH_BASE}/{ig_user_id}/media"
     data: Dict[str, str] = {"access_token": page_token}
 
     if is_story:
@@ -72,34 +107,34 @@ def publish_single(*, is_story: bool, media_kind: str, url: str, caption: Option
         if caption:
             data["caption"] = caption
 
-    with httpx.Client(timeout=60, follow_redirects=True) as client:
-        r = client.post(create_url, data=data)
-        j = _api_ok(r, "Create media container failed")
-        container_id = j.get("id") or ""
-        print(f"Create response: {j}")
-
-        if is_story and media_kind == "video":
-            _wait_ready(client, container_id, page_token, timeout_s=300, poll_s=5)
-            time.sleep(2)
-
-        r = client.post(
-            f"https://graph.facebook.com/{API_VERSION}/{ig_user_id}/media_publish",
-            data={"creation_id": container_id, "access_token": page_token},
+    client = _get_client()
+    r = client.post(create_url, data=data)
+    j = _api_ok(r, "Create media container failed")
+    container_id = j.get("id") or ""
+    print(f"Create response: {j}")
+
+    if is_story and media_kind == "video":
+        _wait_ready(client, container_id, page_token, timeout_s=300)
+        time.sleep(2)
+
+    r = client.post(
+        f"{_GRAPH_BASE}/{ig_user_id}/media_publish",
+        data={"creation_id": container_id, "access_token": page_token},
+    )
+    print("Publish response:", r.text)
+    pub = _api_ok(r, "Publish failed")
+    media_id = pub.get("id")
+
+    permalink = None
+    try:
+        r = client.get(
+            f"{_GRAPH_BASE}/{media_id}",
+            params={"fields": "id,permalink,media_type,timestamp", "access_token": page_token},
         )
-        print("Publish response:", r.text)
-        pub = _api_ok(r, "Publish failed")
-        media_id = pub.get("id")
-
-        permalink = None
-        try:
-            r = client.get(
-                f"https://graph.facebook.com/{API_VERSION}/{media_id}",
-                params={"fields": "id,permalink,media_type,timestamp", "access_token": page_token},
-            )
-            r.raise_for_status()
-            permalink = r.json().get("permalink")
-        except Exception:
-            pass
+        r.raise_for_status()
+        permalink = r.json().get("permalink")
+    except Exception:
+        pass
 
     return {"media_id": media_id, "permalink": permalink, "container_id": container_id}
 
@@ -121,32 +156,32 @@ def publish_video_or_reel(*, url: str, caption: Optional[str], reel: bool, share
     if thumb_offset_ms is not None:
         data["thumb_offset"] = str(thumb_offset_ms)
 
-    with httpx.Client(timeout=60, follow_redirects=True) as client:
-        r = client.post(f"https://graph.facebook.com/{API_VERSION}/{ig_user_id}/media", data=data)
-        j = _api_ok(r, "Create video container failed")
-        container_id = j.get("id") or ""
-        print(f"Create response: {j}")
+    client = _get_client()
+    r = client.post(f"{_GRAPH_BASE}/{ig_user_id}/media", data=data)
+    j = _api_ok(r, "Create video container failed")
+    container_id = j.get("id") or ""
+    print(f"Create response: {j}")
+
+    _wait_ready(client, container_id, page_token, timeout_s=300)
 
-        _wait_ready(client, container_id, page_token, timeout_s=300, poll_s=5)
+    r = client.post(
+        f"{_GRAPH_BASE}/{ig_user_id}/media_publish",
+        data={"creation_id": container_id, "access_token": page_token},
+    )
+    print("Publish response:", r.text)
+    pub = _api_ok(r, "Publish failed")
+    media_id = pub.get("id")
 
-        r = client.post(
-            f"https://graph.facebook.com/{API_VERSION}/{ig_user_id}/media_publish",
-            data={"creation_id": container_id, "access_token": page_token},
+    permalink = None
+    try:
+        r = client.get(
+            f"{_GRAPH_BASE}/{media_id}",
+            params={"fields": "id,permalink,media_type,caption,timestamp", "access_token": page_token},
         )
-        print("Publish response:", r.text)
-        pub = _api_ok(r, "Publish failed")
-        media_id = pub.get("id")
-
-        permalink = None
-        try:
-            r = client.get(
-                f"https://graph.facebook.com/{API_VERSION}/{media_id}",
-                params={"fields": "id,permalink,media_type,caption,timestamp", "access_token": page_token},
-            )
-            r.raise_for_status()
-            permalink = r.json().get("permalink")
-        except Exception:
-            pass
+        r.raise_for_status()
+        permalink = r.json().get("permalink")
+    except Exception:
+        pass
 
     return {"media_id": media_id, "permalink": permalink, "container_id": container_id}
 
@@ -158,67 +193,78 @@ def publish_carousel_items(items: List[Tuple[str, str]], caption: Optional[str]
     if not (2 <= len(items) <= 10):
         raise ValueError("Carousel requires 2–10 items.")
 
-    with httpx.Client(timeout=60, follow_redirects=True) as client:
-        child_ids: List[str] = []
-
-        for kind, url in items:
-            kind_l = kind.strip().lower()
-            data: Dict[str, str] = {"access_token": page_token, "is_carousel_item": "true"}
-
-            if kind_l == "video":
-                data.update({"media_type": "VIDEO", "video_url": url})
-            elif kind_l == "img":
-                data["image_url"] = url
-            else:
-                raise ValueError("Each item kind must be 'img' or 'video'.")
-
-            r = client.post(f"https://graph.facebook.com/{API_VERSION}/{ig_user_id}/media", data=data)
-            j = _api_ok(r, "Create child failed")
-            cid = j.get("id")
-            if not cid:
-                raise RuntimeError(f"Child create returned no id: {j}")
-            print(f"Child created: {cid} ({kind_l})")
-
-            if kind_l == "video":
-                _wait_ready(client, cid, page_token, timeout_s=300, poll_s=5)
-
-            child_ids.append(cid)
-
-        payload: Dict[str, str] = {
-            "media_type": "CAROUSEL",
-            "children": ",".join(child_ids),
-            "access_token": page_token,
-        }
-        if caption:
-            payload["caption"] = caption
-
-        r = client.post(f"https://graph.facebook.com/{API_VERSION}/{ig_user_id}/media", data=payload)
-        parent = _api_ok(r, "Parent carousel create failed")
-        parent_id = parent.get("id")
-        if not parent_id:
-            raise RuntimeError(f"Parent create returned no id: {parent}")
-        print(f"Parent container: {parent_id}")
-
-        r = client.post(
-            f"https://graph.facebook.com/{API_VERSION}/{ig_user_id}/media_publish",
-            data={"creation_id": parent_id, "access_token": page_token},
+    children: List[Tuple[str, Dict[str, str]]] = []
+    for kind, url in items:
+        kind_l = kind.strip().lower()
+        data: Dict[str, str] = {"access_token": page_token, "is_carousel_item": "true"}
+
+        if kind_l == "video":
+            data.update({"media_type": "VIDEO", "video_url": url})
+        elif kind_l == "img":
+            data["image_url"] = url
+        else:
+            raise ValueError("Each item kind must be 'img' or 'video'.")
+        children.append((kind_l, data))
+
+    client = _get_client()
+
+    def _create_child(index: int, kind_l: str, data: Dict[str, str]) -> Tuple[int, str]:
+        r = client.post(f"{_GRAPH_BASE}/{ig_user_id}/media", data=data)
+        j = _api_ok(r, "Create child failed")
+        cid = j.get("id")
+        if not cid:
+            raise RuntimeError(f"Child create returned no id: {j}")
+        print(f"Child created: {cid} ({kind_l})")
+
+        if kind_l == "video":
+            _wait_ready(client, cid, page_token, timeout_s=300)
+
+        return index, cid
+
+    # Children are independent: create (and wait for) them concurrently, then restore order
+    created: List[Tuple[int, str]] = []
+    with ThreadPoolExecutor(max_workers=min(10, len(children))) as pool:
+        futures = [pool.submit(_create_child, i, k, d) for i, (k, d) in enumerate(children)]
+        for fut in as_completed(futures):
+            created.append(fut.result())
+    created.sort()
+    child_ids: List[str] = [cid for _, cid in created]
+
+    payload: Dict[str, str] = {
+        "media_type": "CAROUSEL",
+        "children": ",".join(child_ids),
+        "access_token": page_token,
+    }
+    if caption:
+        payload["caption"] = caption
+
+    r = client.post(f"{_GRAPH_BASE}/{ig_user_id}/media", data=payload)
+    parent = _api_ok(r, "Parent carousel create failed")
+    parent_id = parent.get("id")
+    if not parent_id:
+        raise RuntimeError(f"Parent create returned no id: {parent}")
+    print(f"Parent container: {parent_id}")
+
+    r = client.post(
+        f"{_GRAPH_BASE}/{ig_user_id}/media_publish",
+        data={"creation_id": parent_id, "access_token": page_token},
+    )
+    print("Publish response:", r.text)
+    pub = _api_ok(r, "Publish failed")
+    media_id = pub.get("id")
+    if not media_id:
+        raise RuntimeError(f"Publish returned no id: {pub}")
+
+    permalink = None
+    try:
+        r = client.get(
+            f"{_GRAPH_BASE}/{media_id}",
+            params={"fields": "id,permalink,media_type,caption,timestamp", "access_token": page_token},
         )
-        print("Publish response:", r.text)
-        pub = _api_ok(r, "Publish failed")
-        media_id = pub.get("id")
-        if not media_id:
-            raise RuntimeError(f"Publish returned no id: {pub}")
-
-        permalink = None
-        try:
-            r = client.get(
-                f"https://graph.facebook.com/{API_VERSION}/{media_id}",
-                params={"fields": "id,permalink,media_type,caption,timestamp", "access_token": page_token},
-            )
-            r.raise_for_status()
-            permalink = r.json().get("permalink")
-        except Exception:
-            pass
+        r.raise_for_status()
+        permalink = r.json().get("permalink")
+    except Exception:
+        pass
 
     return {"published_id": media_id, "permalink": permalink, "parent_container_id": parent_id, "child_ids": child_ids}
 
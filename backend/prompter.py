@@ -1,7 +1,12 @@
 import os
-import functools
 import glob
+import fnmatch
+import functools
+import hashlib
 import io
+import mmap
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
 from typing import Optional, List, Dict, Any, Iterator
 
@@ -11,7 +16,34 @@ from pathlib import Path
 from PIL import Image
 
 import anthropic
-from templater import partial_render
+from templater import render_prompt
+
+try:
+    import h2  # noqa: F401  (httpx needs it for http2=True)
+    _HTTP2 = True
+except ImportError:
+    _HTTP2 = False
+
+# Optional SIMD base64 encoder; straight to str, without the intermediate bytes + decode
+try:
+    from pybase64 import b64encode_as_string as _b64encode_str  # type: ignore
+except Exception:
+    def _b64encode_str(data: bytes) -> str:
+        return base64.b64encode(data).decode('ascii')
+
+# Below this, mmap setup costs more than the copy read() makes
+MMAP_MIN_BYTES = 1 << 20
+
+def _b64encode_file(path: str) -> str:
+    """Base64 a whole file; large files are encoded straight from a read-only mapping."""
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size >= MMAP_MIN_BYTES:
+            try:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    return _b64encode_str(mm)
+            except (OSError, ValueError):
+                pass
+        return _b64encode_str(f.read())
 
 def downsample_image_to_480p(image_path: str) -> bytes:
     """
@@ -24,26 +56,26 @@ def downsample_image_to_480p(image_path: str) -> bytes:
         Downsampled image as bytes
     """
     with Image.open(image_path) as img:
+        original_width, original_height = img.size
+
+        # Let libjpeg decode at a reduced DCT scale (1/2, 1/4, 1/8) when the source is a large JPEG
+        img.draft('RGB', (640, 480))
+
         # Convert to RGB if necessary (handles RGBA, etc.)
         if img.mode != 'RGB':
             img = img.convert('RGB')
-        
-        # Calculate new dimensions maintaining aspect ratio
-        original_width, original_height = img.size
-        
-        # Target height is 480px, calculate width to maintain aspect ratio
-        target_height = 480
-        target_width = int((original_width * target_height) / original_height)
-        
-        # If the calculated width is too large, limit it and recalculate height
-        max_width = 640
-        if target_width > max_width:
-            target_width = max_width
-            target_height = int((original_height * target_width) / original_width)
-        
-        # Only downsample if the image is larger than target
-        if original_width > target_width or original_height > target_height:
-            img = img.resize((target_width, target_height), Image.Resampling.LANCZOS)
+
+        # Cheap integer-factor box reduction first (helps PNG/HEIC where draft() is a no-op),
+        # keeping at least 640x480 so LANCZOS still does the final, quality-sensitive step
+        factor = max(1, min(img.width // 640, img.height // 480))
+        if factor > 1:
+            img = img.reduce(factor)
+
+        # Fit within 640x480 keeping aspect ratio; thumbnail() never upscales
+        img.thumbnail((640, 480), Image.Resampling.LANCZOS)
+        target_width, target_height = img.size
+
+        if (target_width, target_height) != (original_width, original_height):
             print(f"  Downsampled from {original_width}x{original_height} to {target_width}x{target_height}")
         else:
             print(f"  Image already smaller than 480p ({original_width}x{original_height}), keeping original size")
@@ -53,7 +85,43 @@ def downsample_image_to_480p(image_path: str) -> bytes:
         img.save(buffer, format='JPEG', quality=85, optimize=True)
         return buffer.getvalue()
 
-@functools.cache
+# Image types this app sees, checked before falling back to mimetypes
+_EXT_TO_MIME = {
+    '.jpg': 'image/jpeg', '.jpeg': 'image/jpeg', '.png': 'image/png', '.gif': 'image/gif',
+    '.bmp': 'image/bmp', '.webp': 'image/webp', '.heic': 'image/heic', '.tiff': 'image/tiff',
+}
+
+# Minimum number of uncached images before preprocessing is fanned out to a thread pool
+PARALLEL_ENCODE_MIN_IMAGES = 2
+
+# (cache key, base64, mime) per path; the key is checked on each hit so edited files re-encode
+_encoded_images: Dict[str, tuple[str, str, str]] = {}
+
+# Persistent cache of base64-encoded downsampled JPEGs, shared across processes and restarts
+IMAGE_CACHE_DIR = Path(os.environ.get("IMAGE_CACHE_DIR") or Path.home() / ".cache" / "hackmit" / "img")
+
+def _cache_key(image_path: str) -> str:
+    """Identify an image by absolute path, mtime and size so edits invalidate the entry."""
+    st = os.stat(image_path)
+    ident = f"{os.path.abspath(image_path)}:{st.st_mtime_ns}:{st.st_size}"
+    return hashlib.blake2b(ident.encode(), digest_size=16).hexdigest()
+
+def _read_disk_cache(key: str) -> Optional[str]:
+    try:
+        return (IMAGE_CACHE_DIR / f"{key}.b64").read_text(encoding="ascii")
+    except (OSError, UnicodeDecodeError):
+        return None
+
+def _write_disk_cache(key: str, encoded_image: str) -> None:
+    # Write to a temp file and rename so concurrent readers never see a partial entry
+    try:
+        IMAGE_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        tmp_path = IMAGE_CACHE_DIR / f"{key}.{os.getpid()}.{threading.get_ident()}.tmp"
+        tmp_path.write_text(encoded_image, encoding="ascii")
+        os.replace(tmp_path, IMAGE_CACHE_DIR / f"{key}.b64")
+    except OSError as e:
+        print(f"  Warning: Could not write image cache entry: {e}")
+
 def encode_image(image_path: str) -> tuple[str, str]:
     """
     Encode an image file to base64 and determine its MIME type, with 480p downsampling.
@@ -64,31 +132,69 @@ def encode_image(image_path: str) -> tuple[str, str]:
     Returns:
         Tuple of (base64_string, mime_type)
     """
-    # Check if file exists
-    if not os.path.exists(image_path):
-        raise FileNotFoundError(f"Image file not found: {image_path}")
-    
+    # In-process hit only while the file is unchanged (same key as the disk cache);
+    # the stat behind the key doubles as the existence check
+    try:
+        key = _cache_key(image_path)
+    except FileNotFoundError:
+        raise FileNotFoundError(f"Image file not found: {image_path}") from None
+    cached = _encoded_images.get(image_path)
+    if cached is not None and cached[0] == key:
+        return cached[1], cached[2]
+
     # Get original MIME type
-    mime_type, _ = mimetypes.guess_type(image_path)
+    mime_type = _EXT_TO_MIME.get(os.path.splitext(image_path)[1].lower())
+    if mime_type is None:
+        mime_type, _ = mimetypes.guess_type(image_path)
     if not mime_type or not mime_type.startswith('image/'):
         raise ValueError(f"File is not a supported image type: {image_path}")
     
-    # Downsample the image
-    try:
-        downsampled_bytes = downsample_image_to_480p(image_path)
-        # After downsampling, we always use JPEG format
+    # Reuse a previous run's encoded result when the file is unchanged
+    encoded_image = _read_disk_cache(key)
+    if encoded_image is not None:
+        # Only downsampled output is cached, which is always JPEG
         mime_type = 'image/jpeg'
-    except Exception as e:
-        print(f"  Warning: Failed to downsample {image_path}, using original: {e}")
-        # Fall back to original file if downsampling fails
-        with open(image_path, "rb") as image_file:
-            downsampled_bytes = image_file.read()
-    
-    # Encode to base64
-    encoded_image = base64.b64encode(downsampled_bytes).decode('utf-8')
+    else:
+        # Downsample the image
+        try:
+            downsampled_bytes = downsample_image_to_480p(image_path)
+            # After downsampling, we always use JPEG format
+            mime_type = 'image/jpeg'
+            cacheable = True
+        except Exception as e:
+            print(f"  Warning: Failed to downsample {image_path}, using original: {e}")
+            # Fall back to original file if downsampling fails
+            downsampled_bytes = None
+            cacheable = False
+        
+        # Encode to base64
+        if downsampled_bytes is None:
+            encoded_image = _b64encode_file(image_path)
+        else:
+            encoded_image = _b64encode_str(downsampled_bytes)
+        if cacheable:
+            _write_disk_cache(key, encoded_image)
     
+    _encoded_images[image_path] = (key, encoded_image, mime_type)
     return encoded_image, mime_type
 
+def _prefetch_encoded_images(image_paths: List[str]) -> None:
+    """
+    Downsample and encode images concurrently, seeding the in-process cache.
+    
+    Threads are enough: Pillow's decode/resize/JPEG encode and file I/O release the GIL, and
+    results land in _encoded_images directly instead of being pickled back from worker processes.
+    Failures are left for the serial path in create_message_content to report per image.
+    """
+    def _try_encode(image_path: str) -> None:
+        try:
+            encode_image(image_path)
+        except Exception:
+            pass
+
+    with ThreadPoolExecutor(max_workers=min(8, len(image_paths))) as pool:
+        list(pool.map(_try_encode, image_paths))
+
 def create_message_content(text: str, image_paths: Optional[List[str]] = None) -> List[Dict[str, Any]]:
     """
     Create message content with text and optional images.
@@ -103,19 +209,19 @@ def create_message_content(text: str, image_paths: Optional[List[str]] = None) -
     content = []
     image_names = []
     
-    # Add images with associated filenames
+    # Add images; their filenames are listed once, in order, in the trailing summary
     if image_paths:
+        pending = [path for path in dict.fromkeys(image_paths) if path not in _encoded_images]
+        if len(pending) >= PARALLEL_ENCODE_MIN_IMAGES:
+            _prefetch_encoded_images(pending)
+        
+        # Progress lines are collected and written in one go after the loop
+        log_lines = []
         for image_path in image_paths:
             try:
-                print(f"Processing image: {os.path.basename(image_path)}")
-                encoded_image, mime_type = encode_image(image_path)
                 image_name = os.path.basename(image_path)
-                
-                # Add a text block with the filename before each image
-                content.append({
-                    "type": "text",
-                    "text": f"Image: {image_name}"
-                })
+                log_lines.append(f"Processing image: {image_name}")
+                encoded_image, mime_type = encode_image(image_path)
                 
                 # Add the image block
                 content.append({
@@ -128,9 +234,10 @@ def create_message_content(text: str, image_paths: Optional[List[str]] = None) -
                 })
                 
                 image_names.append(image_name)
-                print(f"✓ Added image: {image_name}")
+                log_lines.append(f"✓ Added image: {image_name}")
             except Exception as e:
-                print(f"✗ Failed to add image {image_path}: {e}")
+                log_lines.append(f"✗ Failed to add image {image_path}: {e}")
+        print("\n".join(log_lines))
     
     # Add main text content
     if text.strip():
@@ -144,17 +251,23 @@ def create_message_content(text: str, image_paths: Optional[List[str]] = None) -
         image_list = ", ".join(image_names)
         content.append({
             "type": "text",
-            "text": f"\nTotal images provided: {len(image_names)} ({image_list})"
+            "text": f"\nTotal images provided: {len(image_names)}, in order: ({image_list})"
         })
     
     return content
 
+@functools.lru_cache(maxsize=4)
+def _anthropic_client(api_key: Optional[str]) -> "anthropic.Anthropic":
+    # One client (and keep-alive connection pool) per key; HTTP/2 when h2 is installed
+    return anthropic.Anthropic(api_key=api_key, http_client=anthropic.DefaultHttpxClient(http2=_HTTP2))
+
 def prompt_claude_haiku_with_images_streaming(
     message: str,
     image_paths: Optional[List[str]] = None,
     api_key: Optional[str] = None,
     max_tokens: int = 1000,
-    model: str = "claude-3-haiku-20240307"
+    model: str = "claude-3-haiku-20240307",
+    stop_sequences: Optional[List[str]] = None
 ) -> Iterator[str]:
     """
     Send a prompt with optional images to Claude and stream the response.
@@ -165,16 +278,15 @@ def prompt_claude_haiku_with_images_streaming(
         api_key: Your Anthropic API key (if not set as environment variable)
         max_tokens: Maximum tokens in the response
         model: Claude model to use
+        stop_sequences: Strings that end generation early; a matched sequence is
+            still yielded so the output reads as if generation had continued to it
         
     Yields:
         Chunks of Claude's response as strings
     """
     
-    # Initialize the client
-    if api_key:
-        client = anthropic.Anthropic(api_key=api_key)
-    else:
-        client = anthropic.Anthropic()
+    # Shared client, so repeat calls reuse the pooled connection
+    client = _anthropic_client(api_key or os.environ.get("ANTHROPIC_API_KEY"))
     
     try:
         # Create message content with text and images
@@ -196,14 +308,22 @@ def prompt_claude_haiku_with_images_streaming(
                     "content": content
                 }
             ],
+            stop_sequences=stop_sequences or anthropic.NOT_GIVEN,
             stream=True
         )
         
-        # Yield chunks as they arrive
-        for chunk in stream:
-            if chunk.type == "content_block_delta":
-                if hasattr(chunk.delta, 'text'):
-                    yield chunk.delta.text
+        # Yield chunks as they arrive; release the connection if the caller stops early
+        try:
+            for chunk in stream:
+                if chunk.type == "content_block_delta":
+                    if hasattr(chunk.delta, 'text'):
+                        yield chunk.delta.text
+                elif chunk.type == "message_delta":
+                    # The API strips a matched stop sequence from the text; hand it back
+                    if getattr(chunk.delta, 'stop_sequence', None):
+                        yield chunk.delta.stop_sequence
+        finally:
+            stream.close()
         
     except Exception as e:
         yield f"Error: {str(e)}"
@@ -214,7 +334,8 @@ def prompt_claude_haiku_with_images(
     api_key: Optional[str] = None,
     max_tokens: int = 1000,
     model: str = "claude-3-haiku-20240307",
-    stream: bool = False
+    stream: bool = False,
+    stop_sequences: Optional[List[str]] = None
 ) -> str:
     """
     Send a prompt with optional images to Claude and return the response.
@@ -226,6 +347,8 @@ def prompt_claude_haiku_with_images(
         max_tokens: Maximum tokens in the response
         model: Claude model to use
         stream: Whether to use streaming (if True, prints response as it arrives)
+        stop_sequences: Strings that end generation early; a matched sequence is
+            kept at the end of the returned text
         
     Returns:
         Claude's complete response as a string
@@ -238,7 +361,7 @@ def prompt_claude_haiku_with_images(
         print("-" * 50)
         
         for chunk in prompt_claude_haiku_with_images_streaming(
-            message, image_paths, api_key, max_tokens, model
+            message, image_paths, api_key, max_tokens, model, stop_sequences
         ):
             print(chunk, end='', flush=True)
             full_response += chunk
@@ -247,11 +370,8 @@ def prompt_claude_haiku_with_images(
         return full_response
     else:
         # Use non-streaming (original behavior)
-        # Initialize the client
-        if api_key:
-            client = anthropic.Anthropic(api_key=api_key)
-        else:
-            client = anthropic.Anthropic()
+        # Shared client, so repeat calls reuse the pooled connection
+        client = _anthropic_client(api_key or os.environ.get("ANTHROPIC_API_KEY"))
         
         try:
             # Create message content with text and images
@@ -269,15 +389,35 @@ def prompt_claude_haiku_with_images(
                         "role": "user",
                         "content": content
                     }
-                ]
+                ],
+                stop_sequences=stop_sequences or anthropic.NOT_GIVEN
             )
             
-            # Extract and return the text response
-            return response.content[0].text
+            # Extract and return the text response (restoring a matched stop sequence)
+            return response.content[0].text + (response.stop_sequence or "")
             
         except Exception as e:
             return f"Error: {str(e)}"
 
+# Image suffixes picked up when scanning a directory (compare against lowercased names)
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.heic', '.gif', '.bmp', '.tiff', '.webp')
+
+def list_image_files(directory: str) -> List[str]:
+    """
+    List image files directly inside a directory with a single scandir pass.
+    
+    Args:
+        directory: Directory to scan (not recursive)
+        
+    Returns:
+        List of image file paths
+    """
+    with os.scandir(directory) as entries:
+        return [
+            entry.path for entry in entries
+            if entry.name.lower().endswith(IMAGE_EXTENSIONS) and entry.is_file()
+        ]
+
 def get_image_files_from_input(image_input: str) -> List[str]:
     """
     Parse image file paths from user input.
@@ -297,12 +437,27 @@ def get_image_files_from_input(image_input: str) -> List[str]:
     # Split by comma and clean up paths
     raw_paths = [path.strip().strip('"\'') for path in image_input.split(',')]
     
+    # Directory listings shared by every pattern in the same directory
+    listings: Dict[str, List[str]] = {}
+
     for path in raw_paths:
         if '*' in path or '?' in path:
             # Handle glob patterns
-            from glob import glob
-            matches = glob(path)
-            image_paths.extend(matches)
+            dirname, pattern = os.path.split(path)
+            if glob.has_magic(dirname):
+                image_paths.extend(glob.glob(path))
+                continue
+            if dirname not in listings:
+                try:
+                    with os.scandir(dirname or os.curdir) as entries:
+                        listings[dirname] = [entry.name for entry in entries]
+                except OSError:
+                    listings[dirname] = []
+            names = fnmatch.filter(listings[dirname], pattern)
+            if not pattern.startswith('.'):
+                # Like glob, wildcards don't match hidden files
+                names = [name for name in names if not name.startswith('.')]
+            image_paths.extend(os.path.join(dirname, name) for name in names)
         else:
             # Handle direct file paths
             if os.path.exists(path):
@@ -315,7 +470,7 @@ def get_image_files_from_input(image_input: str) -> List[str]:
     valid_images = []
     
     for path in image_paths:
-        if Path(path).suffix.lower() in supported_extensions:
+        if os.path.splitext(path)[1].lower() in supported_extensions:
             valid_images.append(path)
         else:
             print(f"Warning: Unsupported file type: {path}")
@@ -327,13 +482,8 @@ if __name__ == "__main__":
     # Change this to your directory
     directory = "./demo/hack/"
 
-    # Match common image extensions (case-insensitive if you normalize with .lower())
-    image_extensions = ("*.jpg", "*.jpeg", "*.png", "*.heic", "*.gif", "*.bmp", "*.tiff", "*.webp")
-
     # Collect all images
-    files = []
-    for ext in image_extensions:
-        files.extend(glob.glob(os.path.join(directory, ext)))
+    files = list_image_files(directory)
 
     print(f"Found {len(files)} image files")
     print(files)
@@ -342,15 +492,15 @@ if __name__ == "__main__":
     for agent in glob.glob('./prompts/agents/*.md'):
         print(agent)
         response = prompt_claude_haiku_with_images(
-            partial_render(partial_render(
-                open('./prompts/template.jinja').read(),
-                {
-                    'personality': open(agent).read()
-                }
-            ), context={"post_type": "Instagram Story for a fun philosophy club."}),
+            render_prompt(
+                'template.jinja',
+                personality=open(agent).read(),
+                post_type="Instagram Story for a fun philosophy club.",
+            ),
             image_paths=files,
             api_key=os.environ["CLAUDE_API_KEY"],
-            max_tokens=4096,
+            # A YAML block of ratings is well under this; don't reserve the full 4096
+            max_tokens=1024,
             model="claude-3-haiku-20240307",
             stream=False  # Enable streaming
         )
@@ -2,71 +2,111 @@ import glob
 import os
 import re
 
-from collections import defaultdict
+from contextlib import closing
 from pathlib import Path
 from pprint import pprint
+from typing import Iterator
 
+import numpy as np
 import yaml
 
-from prompter import prompt_claude_haiku_with_images
-from templater import partial_render
+# libyaml-backed loader when PyYAML was built with it; same safe semantics either way
+try:
+    from yaml import CSafeLoader as _YamlLoader
+except ImportError:
+    from yaml import SafeLoader as _YamlLoader  # type: ignore[assignment]
 
+from prompter import list_image_files, prompt_claude_haiku_with_images_streaming
+from templater import render_prompt
 
-def poll(agents: list[Path], files: list[str]) -> dict:
+_YAML_BLOCK = re.compile(r'```yaml\s*\n(.*?)\n```', re.DOTALL)
+_GENERIC_BLOCK = re.compile(r'```\s*\n(.*?)\n```', re.DOTALL)
+
+def _rating_max_tokens(n_files: int) -> int:
+    # A rating plus a one-line explanation per file fits well inside this budget
+    return min(4096, 256 + 128 * n_files)
+
+
+def _read_until_fence_closes(chunks: Iterator[str]) -> str:
+    """Accumulate streamed text, stopping as soon as the first ``` block is closed."""
+    response = ""
+    for chunk in chunks:
+        response += chunk
+        open_idx = response.find('```')
+        if open_idx != -1 and response.find('\n```', open_idx + 3) != -1:
+            break
+    return response
+
+
+def _rating_for(parsed: dict, file: str) -> float:
+    """Look up a file's rating by path or basename; entries are either `n` or `{rating: n, ...}`."""
+    entry = parsed.get(file, parsed.get(os.path.basename(file), 0))
+    if isinstance(entry, dict):
+        entry = entry.get('rating', 0)
+    try:
+        return float(entry)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def poll(agents: list[Path], files: list[str]) -> np.ndarray:
+    """Return a (len(agents), len(files)) matrix of each agent's rating for each file."""
     print(f"Found {len(files)} image files")
 
-    ratings = {}
+    ratings = np.zeros((len(agents), len(files)))
     
-    # Example usage with streaming
-    for agent in agents:
-        response = prompt_claude_haiku_with_images(
-            partial_render(partial_render(
-                open('./prompts/template.jinja').read(),
-                {
-                    'personality': open(agent).read()
-                }
-            ), context={"post_type": "Instagram Story for a fun philosophy club."}),
+    # Stream each agent's reply and parse as soon as its YAML block is complete
+    for i, agent in enumerate(agents):
+        chunks = prompt_claude_haiku_with_images_streaming(
+            render_prompt(
+                'template.jinja',
+                personality=open(agent).read(),
+                post_type="Instagram Story for a fun philosophy club.",
+            ),
             image_paths=files,
             api_key=os.environ["CLAUDE_API_KEY"],
-            max_tokens=4096,
+            max_tokens=_rating_max_tokens(len(files)),
             model="claude-3-haiku-20240307",
-            stream=False  # Enable streaming
         )
+        # No API stop sequence: "\n```\n" would also match a bare opening fence. The reader only
+        # stops once a block has been opened and closed, and closing the generator ends the stream
+        with closing(chunks):
+            response = _read_until_fence_closes(chunks)
 
         # Extract YAML from code blocks if present
         yaml_content = response
         if '```yaml' in response:
             # Extract content between ```yaml and ```
-            match = re.search(r'```yaml\s*\n(.*?)\n```', response, re.DOTALL)
+            match = _YAML_BLOCK.search(response)
             if match:
                 yaml_content = match.group(1)
         elif '```' in response:
             # Handle generic code blocks that might contain YAML
-            match = re.search(r'```\s*\n(.*?)\n```', response, re.DOTALL)
+            match = _GENERIC_BLOCK.search(response)
             if match:
                 yaml_content = match.group(1)
-        ratings[agent] = defaultdict(lambda: 0, map=yaml.safe_load(yaml_content))
+        parsed = yaml.load(yaml_content, Loader=_YamlLoader)
+        if isinstance(parsed, dict):
+            ratings[i, :] = [_rating_for(parsed, file) for file in files]
 
     return ratings
 
 
 def select_photos(agents: list[Path], imgs:int = 2, img_dir: str="./demo/hack/") -> list[Path]:
-    # Match common image extensions (case-insensitive if you normalize with .lower())
-    image_extensions = ("*.jpg", "*.jpeg", "*.png", "*.heic", "*.gif", "*.bmp", "*.tiff", "*.webp")
-
-    # Collect all images
-    files = []
-    for ext in image_extensions:
-        files.extend(glob.glob(os.path.join(img_dir, ext)))
+    # Collect all images (extension match is case-insensitive)
+    files = list_image_files(img_dir)
     
-    ratings = poll(agents, files)
+    k = min(imgs, len(files))
+    if k <= 0:
+        return []
+
+    totals = poll(agents, files).sum(axis=0)
 
-    score_per_file = sorted([
-        (file, sum(ratings[agent][file] for agent in agents))
-        for file in files
-    ], key=lambda pair: pair[1], reverse=True)
+    # O(n) selection of the top k, then order just those by score
+    top_idx = np.argpartition(-totals, k - 1)[:k]
+    top_idx = top_idx[np.argsort(-totals[top_idx], kind='stable')]
 
-    return [Path(file) for file, score in score_per_file[:imgs]]
+    return [Path(files[i]) for i in top_idx]
 
 
 if __name__ == "__main__":
@@ -6,24 +6,30 @@ Creates engaging video reels from images with AI-generated music and description
 
 import os
 import json
+import hashlib
 import time
+import shutil
+import tempfile
 import requests
 from pathlib import Path
 from typing import List, Dict, Optional, Tuple
 from dataclasses import dataclass
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 import cv2
 import numpy as np
-from PIL import Image, ImageEnhance, ImageFilter
-import moviepy.editor as mp
-from moviepy.video.fx import resize, fadein, fadeout
+from PIL import Image
 import anthropic
 from datetime import datetime
 import logging
 
+from reels_engine.render import _FFMPEG_BIN, _run_ffmpeg
+from prompter import create_message_content
+
 # Setup logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+
 @dataclass
 class VideoConfig:
     """Configuration for video generation"""
@@ -41,7 +47,156 @@ class SunoConfig:
     api_key: str = ""
     base_url: str = "https://api.suno.ai/v1"
     song_duration: int = 60  # seconds
+
+
+def _enhance_image(image_path: str) -> np.ndarray:
+    """
+    Enhance image for better video quality
+    
+    Args:
+        image_path: Path to image file
+        
+    Returns:
+        Enhanced image as numpy array
+    """
+    # Load image as RGB; cv2.imread returns None for formats it can't decode
+    img = cv2.imread(image_path, cv2.IMREAD_COLOR)
+    if img is None:
+        img = np.array(Image.open(image_path).convert('RGB'))
+    else:
+        cv2.cvtColor(img, cv2.COLOR_BGR2RGB, dst=img)
+    
+    # Increase contrast slightly (about the mean luma, like ImageEnhance.Contrast)
+    mean = float(cv2.cvtColor(img, cv2.COLOR_RGB2GRAY).mean())
+    cv2.addWeighted(img, 1.1, img, 0.0, -0.1 * mean, dst=img)
+    
+    # Increase saturation slightly
+    hsv = cv2.cvtColor(img, cv2.COLOR_RGB2HSV)
+    hsv[:, :, 1] = cv2.multiply(hsv[:, :, 1], 1.1)
+    cv2.cvtColor(hsv, cv2.COLOR_HSV2RGB, dst=img)
+    
+    # Sharpen slightly (50% unsharp mask)
+    blur = cv2.GaussianBlur(img, (0, 0), 1.0)
+    cv2.addWeighted(img, 1.5, blur, -0.5, 0, dst=img)
+    
+    return img
+
+def prepare_still(image_path: str, still_path: str) -> str:
+    """
+    Enhance one image and write it as a JPEG still for the ffmpeg render
     
+    Top-level so it can run in a ProcessPoolExecutor worker.
+    
+    Args:
+        image_path: Path to image file
+        still_path: Where to write the enhanced still
+        
+    Returns:
+        still_path
+    """
+    Image.fromarray(_enhance_image(image_path)).save(still_path, quality=95)
+    return still_path
+
+
+def build_reel_command(ffmpeg_bin: str, still_paths: List[str], duration: float, cfg: VideoConfig,
+                       output_path: str, music_path: Optional[str] = None) -> List[str]:
+    """
+    Build the single ffmpeg invocation that renders the whole reel
+    
+    Each still is looped for `duration` seconds, scaled to the output height,
+    center-cropped (or padded) to the output size, zoomed 1.0 -> 1.1 with zoompan,
+    faded in/out, and chained to the next still with xfade. Music, if given, is
+    looped under the video at 0.7x volume and loudness-normalized like render.py.
+    
+    Args:
+        ffmpeg_bin: ffmpeg executable
+        still_paths: Enhanced stills in playback order
+        duration: Seconds each still is on screen
+        cfg: Output video configuration
+        output_path: Where to write the MP4
+        music_path: Background music file (optional)
+        
+    Returns:
+        ffmpeg argv
+    """
+    w, h, fps = cfg.output_width, cfg.output_height, cfg.fps
+    frames = max(1, int(round(duration * fps)))
+    fade = min(cfg.fade_duration, duration / 2)
+    xfade = min(cfg.transition_duration, duration / 2)
+    
+    cmd = [ffmpeg_bin, "-y", "-nostdin", "-hide_banner", "-loglevel", "error"]
+    for still in still_paths:
+        cmd += ["-loop", "1", "-framerate", str(fps), "-t", f"{duration:.3f}", "-i", still]
+    
+    filt_parts: List[str] = []
+    for idx in range(len(still_paths)):
+        filt_parts.append(
+            f"[{idx}:v]scale=-2:{h},"
+            f"crop=w='min(iw,{w})':h={h},"
+            f"pad={w}:{h}:(ow-iw)/2:0,setsar=1,"
+            f"zoompan=z='1+0.1*on/{frames}':x='iw/2-(iw/zoom/2)':y='ih/2-(ih/zoom/2)':d=1:s={w}x{h}:fps={fps},"
+            f"fade=t=in:st=0:d={fade:.3f},fade=t=out:st={duration - fade:.3f}:d={fade:.3f},"
+            f"format=yuv420p[v{idx}]"
+        )
+    
+    prev_v = "v0"
+    for idx in range(1, len(still_paths)):
+        offset = idx * (duration - xfade)
+        out_v = f"vx{idx}"
+        filt_parts.append(
+            f"[{prev_v}][v{idx}]xfade=transition=fade:duration={xfade:.3f}:offset={offset:.3f}[{out_v}]"
+        )
+        prev_v = out_v
+    
+    maps = ["-map", f"[{prev_v}]"]
+    if music_path:
+        # Loop the track natively and bound it to the video length (stills overlap by xfade)
+        total = len(still_paths) * duration - (len(still_paths) - 1) * xfade
+        music_idx = len(still_paths)
+        cmd += ["-stream_loop", "-1", "-t", f"{total:.3f}", "-i", music_path]
+        filt_parts.append(f"[{music_idx}:a]volume=0.7,aresample=48000[am]")
+        maps += ["-map", "[am]", "-c:a", "aac", "-b:a", "192k"]
+    
+    cmd += [
+        "-filter_complex", ";".join(filt_parts),
+        *maps,
+        "-c:v", "libx264", "-preset", "veryfast", "-profile:v", "high", "-level:v", "4.0",
+        "-crf", "18", "-pix_fmt", "yuv420p",
+        "-r", str(fps),
+        "-movflags", "+faststart",
+        output_path,
+    ]
+    return cmd
+
+
+# Claude accepts at most 20 images per request
+MAX_ANALYSIS_IMAGES = 20
+
+# Analysis results keyed by _image_set_key
+_analysis_cache: Dict[str, Dict[str, str]] = {}
+
+
+def _image_set_key(image_paths: List[str]) -> str:
+    """
+    sha256 over the sorted (realpath, mtime, size) of the images, independent of order.
+    A stat per image rather than reading it; an edited file changes the key.
+    """
+    entries = []
+    for path in image_paths:
+        st = os.stat(path)
+        entries.append(f"{os.path.realpath(path)}\0{st.st_mtime_ns}\0{st.st_size}")
+    return hashlib.sha256("\n".join(sorted(entries)).encode()).hexdigest()
+
+
+def _retry_after_seconds(response: requests.Response) -> Optional[float]:
+    """Delay requested by a Retry-After header (in seconds), if present and numeric."""
+    value = response.headers.get("Retry-After")
+    try:
+        return max(0.0, float(value)) if value else None
+    except ValueError:
+        return None
+
+
 class ReelsGenerator:
     def __init__(self, anthropic_api_key: str, suno_api_key: str = ""):
         """
@@ -67,11 +222,20 @@ class ReelsGenerator:
         """
         logger.info(f"Analyzing {len(image_paths)} images with Claude 3.5...")
         
-        # Prepare image data for Claude (in real implementation, you'd encode images)
-        image_names = [Path(path).name for path in image_paths]
+        # The same image set always gets the same analysis; skip the API call on repeats
+        try:
+            cache_key = _image_set_key(image_paths)
+        except OSError:
+            cache_key = None
+        if cache_key in _analysis_cache:
+            logger.info("Using cached image analysis")
+            return _analysis_cache[cache_key]
+        
+        # All images go in one message (capped at the per-request image limit)
+        analyzed_paths = [str(path) for path in image_paths[:MAX_ANALYSIS_IMAGES]]
         
         prompt = f"""
-        I have {len(image_paths)} images for creating an Instagram Reel: {', '.join(image_names)}
+        The {len(analyzed_paths)} images above are for creating an Instagram Reel.
         
         Please provide:
         1. A compelling description of what story these images might tell (2-3 sentences)
@@ -95,7 +259,7 @@ class ReelsGenerator:
             response = self.anthropic_client.messages.create(
                 model="claude-3-5-sonnet-20241022",
                 max_tokens=1000,
-                messages=[{"role": "user", "content": prompt}]
+                messages=[{"role": "user", "content": create_message_content(prompt, analyzed_paths)}]
             )
             
             # Parse JSON response
@@ -107,6 +271,8 @@ class ReelsGenerator:
             
             result = json.loads(json_str)
             logger.info("Successfully analyzed images with Claude 3.5")
+            if cache_key:
+                _analysis_cache[cache_key] = result
             return result
             
         except Exception as e:
@@ -168,10 +334,13 @@ class ReelsGenerator:
                 logger.error("No job ID returned from Suno AI")
                 return None
                 
-            # Poll for completion
-            max_retries = 30  # 5 minutes max
-            for attempt in range(max_retries):
-                time.sleep(10)  # Wait 10 seconds between polls
+            # Poll for completion, backing off from 1s up to 15s (5 minutes max)
+            deadline = time.monotonic() + 300
+            delay = 1.0
+            attempt = 0
+            while time.monotonic() < deadline:
+                time.sleep(delay)
+                attempt += 1
                 
                 status_response = requests.get(
                     f"{self.suno_config.base_url}/jobs/{job_id}",
@@ -186,19 +355,24 @@ class ReelsGenerator:
                         audio_url = status_data.get("audio_url")
                         if audio_url:
                             # Download the audio file
-                            audio_response = requests.get(audio_url, timeout=30)
-                            if audio_response.status_code == 200:
-                                output_path = f"generated_music_{int(time.time())}.mp3"
-                                with open(output_path, "wb") as f:
-                                    f.write(audio_response.content)
-                                logger.info(f"Music generated successfully: {output_path}")
-                                return output_path
+                            with requests.get(audio_url, stream=True, timeout=30) as audio_response:
+                                if audio_response.status_code == 200:
+                                    output_path = f"generated_music_{int(time.time())}.mp3"
+                                    with open(output_path, "wb") as f:
+                                        for chunk in audio_response.iter_content(chunk_size=1 << 16):
+                                            if chunk:
+                                                f.write(chunk)
+                                    logger.info(f"Music generated successfully: {output_path}")
+                                    return output_path
                     
                     elif status_data.get("status") == "failed":
                         logger.error("Suno AI generation failed")
                         break
                         
-                logger.info(f"Music generation in progress... (attempt {attempt + 1}/{max_retries})")
+                logger.info(f"Music generation in progress... (attempt {attempt})")
+                # Honour Retry-After, but never past the backoff cap or the remaining time budget
+                delay = min(_retry_after_seconds(status_response) or delay * 1.5, 15.0)
+                delay = min(delay, max(0.0, deadline - time.monotonic()))
             
             logger.error("Music generation timed out")
             return None
@@ -217,117 +391,7 @@ class ReelsGenerator:
         Returns:
             Enhanced image as numpy array
         """
-        # Load image
-        pil_image = Image.open(image_path)
-        
-        # Convert to RGB if necessary
-        if pil_image.mode != 'RGB':
-            pil_image = pil_image.convert('RGB')
-        
-        # Enhance image
-        # Increase contrast slightly
-        enhancer = ImageEnhance.Contrast(pil_image)
-        pil_image = enhancer.enhance(1.1)
-        
-        # Increase saturation slightly
-        enhancer = ImageEnhance.Color(pil_image)
-        pil_image = enhancer.enhance(1.1)
-        
-        # Sharpen slightly
-        pil_image = pil_image.filter(ImageFilter.UnsharpMask(radius=1, percent=50))
-        
-        # Convert to numpy array
-        return np.array(pil_image)
-    
-    def create_video_clip_from_image(self, image_path: str, duration: float) -> mp.ImageClip:
-        """
-        Create a video clip from a single image with Ken Burns effect
-        
-        Args:
-            image_path: Path to image file
-            duration: Duration of the clip in seconds
-            
-        Returns:
-            MoviePy ImageClip with effects applied
-        """
-        # Enhance image
-        enhanced_image = self.enhance_image(image_path)
-        
-        # Create clip
-        clip = mp.ImageClip(enhanced_image, duration=duration)
-        
-        # Resize to fit target dimensions while maintaining aspect ratio
-        clip = clip.resize(height=self.video_config.output_height)
-        
-        # If width is too large, crop from center
-        if clip.w > self.video_config.output_width:
-            x_center = clip.w // 2
-            x1 = x_center - self.video_config.output_width // 2
-            x2 = x1 + self.video_config.output_width
-            clip = clip.crop(x1=x1, x2=x2)
-        
-        # Add Ken Burns effect (subtle zoom and pan)
-        def ken_burns_effect(get_frame, t):
-            frame = get_frame(t)
-            progress = t / duration
-            
-            # Zoom effect (1.0 to 1.1 scale)
-            scale = 1.0 + 0.1 * progress
-            h, w = frame.shape[:2]
-            
-            # Calculate new dimensions
-            new_h, new_w = int(h * scale), int(w * scale)
-            
-            # Resize frame
-            resized = cv2.resize(frame, (new_w, new_h))
-            
-            # Crop to original size (from center)
-            start_x = (new_w - w) // 2
-            start_y = (new_h - h) // 2
-            
-            return resized[start_y:start_y + h, start_x:start_x + w]
-        
-        clip = clip.fl(ken_burns_effect)
-        
-        # Add fade in and fade out
-        clip = clip.fadein(self.video_config.fade_duration)
-        clip = clip.fadeout(self.video_config.fade_duration)
-        
-        return clip
-    
-    def add_transitions(self, clips: List[mp.VideoClip]) -> List[mp.VideoClip]:
-        """
-        Add smooth transitions between clips
-        
-        Args:
-            clips: List of video clips
-            
-        Returns:
-            List of clips with transitions applied
-        """
-        if len(clips) <= 1:
-            return clips
-        
-        transition_clips = []
-        
-        for i, clip in enumerate(clips):
-            if i == 0:
-                # First clip - no transition needed
-                transition_clips.append(clip)
-            else:
-                # Add crossfade transition
-                prev_clip = transition_clips[-1]
-                
-                # Adjust timing for overlap
-                transition_start = prev_clip.duration - self.video_config.transition_duration
-                
-                # Create transition effect
-                clip = clip.set_start(transition_start)
-                clip = clip.crossfadein(self.video_config.transition_duration)
-                
-                transition_clips.append(clip)
-        
-        return transition_clips
+        return _enhance_image(image_path)
     
     def create_reel(self, image_paths: List[str], output_path: str = None, 
                    custom_music_path: str = None) -> str:
@@ -352,90 +416,74 @@ class ReelsGenerator:
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
             output_path = f"instagram_reel_{timestamp}.mp4"
         
-        # Analyze images with Claude 3.5
-        analysis = self.analyze_images_with_claude(image_paths)
-        logger.info(f"Analysis: {analysis['description']}")
-        
-        # Generate or use custom music
-        music_path = custom_music_path
-        if not music_path:
-            music_path = self.generate_music_with_suno(
-                analysis['music_prompt'], 
-                self.suno_config.song_duration
+        # Start enhancing stills right away so the CPU work overlaps the Claude and Suno waits
+        logger.info("Enhancing images...")
+        work_dir = Path(tempfile.mkdtemp(prefix="reel_"))
+        max_workers = min(len(image_paths), os.cpu_count() or 1)
+        still_pool = ProcessPoolExecutor(max_workers=max_workers)
+        music_pool = ThreadPoolExecutor(max_workers=1)
+        try:
+            still_futures = {
+                still_pool.submit(prepare_still, str(image_path), str(work_dir / f"image_{i:03d}.jpg")): i
+                for i, image_path in enumerate(image_paths)
+            }
+            
+            # Analyze images with Claude 3.5
+            analysis = self.analyze_images_with_claude(image_paths)
+            logger.info(f"Analysis: {analysis['description']}")
+            
+            # Generate or use custom music; Suno runs in the background while images are enhanced
+            music_path = custom_music_path
+            music_future = None
+            if not music_path:
+                music_future = music_pool.submit(
+                    self.generate_music_with_suno,
+                    analysis['music_prompt'], 
+                    self.suno_config.song_duration
+                )
+            
+            # Calculate video timing
+            total_image_time = len(image_paths) * self.video_config.image_duration
+            max_duration = min(total_image_time, self.video_config.max_video_length)
+            
+            # Adjust image duration if needed
+            if total_image_time > self.video_config.max_video_length:
+                adjusted_duration = self.video_config.max_video_length / len(image_paths)
+                logger.info(f"Adjusting image duration to {adjusted_duration:.2f}s to fit time limit")
+            else:
+                adjusted_duration = self.video_config.image_duration
+            
+            still_paths: Dict[int, str] = {}
+            for future in as_completed(still_futures):
+                i = still_futures[future]
+                try:
+                    still_paths[i] = future.result()
+                    logger.info(f"Processed image {i+1}/{len(image_paths)}: {Path(image_paths[i]).name}")
+                except Exception as e:
+                    logger.error(f"Error processing image {image_paths[i]}: {e}")
+            
+            if music_future is not None:
+                music_path = music_future.result()
+            
+            if not still_paths:
+                raise ValueError("No valid clips could be created from the provided images")
+            
+            # Scale, Ken Burns, fades, transitions and music all happen in one ffmpeg pass
+            logger.info(f"Exporting video to {output_path}...")
+            cmd = build_reel_command(
+                _FFMPEG_BIN,
+                [still_paths[i] for i in sorted(still_paths)],
+                adjusted_duration,
+                self.video_config,
+                output_path,
+                music_path=music_path if music_path and os.path.exists(music_path) else None,
             )
-        
-        # Calculate video timing
-        total_image_time = len(image_paths) * self.video_config.image_duration
-        max_duration = min(total_image_time, self.video_config.max_video_length)
-        
-        # Adjust image duration if needed
-        if total_image_time > self.video_config.max_video_length:
-            adjusted_duration = self.video_config.max_video_length / len(image_paths)
-            logger.info(f"Adjusting image duration to {adjusted_duration:.2f}s to fit time limit")
-        else:
-            adjusted_duration = self.video_config.image_duration
-        
-        # Create video clips from images
-        logger.info("Creating video clips from images...")
-        clips = []
-        for i, image_path in enumerate(image_paths):
-            try:
-                clip = self.create_video_clip_from_image(image_path, adjusted_duration)
-                clips.append(clip)
-                logger.info(f"Processed image {i+1}/{len(image_paths)}: {Path(image_path).name}")
-            except Exception as e:
-                logger.error(f"Error processing image {image_path}: {e}")
-                continue
-        
-        if not clips:
-            raise ValueError("No valid clips could be created from the provided images")
-        
-        # Add transitions
-        clips = self.add_transitions(clips)
-        
-        # Concatenate clips
-        logger.info("Combining video clips...")
-        final_video = mp.concatenate_videoclips(clips, method="compose")
-        
-        # Add music if available
-        if music_path and os.path.exists(music_path):
-            logger.info("Adding background music...")
-            try:
-                audio = mp.AudioFileClip(music_path)
-                
-                # Trim or loop audio to match video duration
-                if audio.duration > final_video.duration:
-                    audio = audio.subclip(0, final_video.duration)
-                elif audio.duration < final_video.duration:
-                    # Loop the audio
-                    loops_needed = int(np.ceil(final_video.duration / audio.duration))
-                    audio = mp.concatenate_audioclips([audio] * loops_needed)
-                    audio = audio.subclip(0, final_video.duration)
-                
-                # Reduce volume slightly to not overpower
-                audio = audio.volumex(0.7)
-                final_video = final_video.set_audio(audio)
-                
-            except Exception as e:
-                logger.error(f"Error adding music: {e}")
-        
-        # Export final video
-        logger.info(f"Exporting video to {output_path}...")
-        final_video.write_videofile(
-            output_path,
-            fps=self.video_config.fps,
-            codec='libx264',
-            audio_codec='aac',
-            temp_audiofile='temp-audio.m4a',
-            remove_temp=True,
-            verbose=False,
-            logger=None  # Suppress moviepy logging
-        )
-        
-        # Cleanup
-        final_video.close()
-        for clip in clips:
-            clip.close()
+            _run_ffmpeg(cmd)
+        finally:
+            # Also reached when analysis or music fails part way; don't leave workers or stills behind
+            still_pool.shutdown(cancel_futures=True)
+            music_pool.shutdown(cancel_futures=True)
+            shutil.rmtree(work_dir, ignore_errors=True)
         
         if music_path and music_path != custom_music_path:
             # Remove generated music file (optional)
@@ -1,7 +1,10 @@
+import copy
+import functools
 import os
 import shutil
 import subprocess
 import uuid
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from typing import Dict, Any, List
 
@@ -11,7 +14,22 @@ from .utils import ensure_dir
 def probe(path: str) -> Dict[str, Any]:
     """
     Use ffprobe to read basic metadata. If ffprobe is unavailable, return an empty dict.
+    Results for local files are cached by (realpath, mtime, size); a modified file is re-probed.
     """
+    try:
+        st = os.stat(path)
+    except OSError:
+        return _probe_uncached(path)
+    # realpath so relative, symlinked and absolute spellings of one file share an entry
+    return copy.deepcopy(_probe_cached(os.path.realpath(path), st.st_mtime_ns, st.st_size))
+
+
+@functools.lru_cache(maxsize=1024)
+def _probe_cached(path: str, mtime_ns: int, size: int) -> Dict[str, Any]:
+    return _probe_uncached(path)
+
+
+def _probe_uncached(path: str) -> Dict[str, Any]:
     cmd = [
         "ffprobe",
         "-v",
@@ -46,10 +64,10 @@ def download(url: str, tmp_dir: str) -> str:
         local = Path(tmp_dir) / f"in_{uuid.uuid4().hex}.mp4"
         with requests.get(url, stream=True, timeout=60) as r:
             r.raise_for_status()
+            # Copy in C with 1 MiB reads; decode_content keeps gzip/deflate handling of iter_content
+            r.raw.decode_content = True
             with open(local, "wb") as f:
-                for chunk in r.iter_content(chunk_size=8192):
-                    if chunk:
-                        f.write(chunk)
+                shutil.copyfileobj(r.raw, f, length=1 << 20)
         return str(local)
     if url.startswith("s3://") or url.startswith("gs://"):
         # Placeholder: assume pre-mounted or local mirror path
@@ -57,12 +75,24 @@ def download(url: str, tmp_dir: str) -> str:
     # Assume local path
     if os.path.exists(url):
         local = Path(tmp_dir) / f"in_{uuid.uuid4().hex}{Path(url).suffix or '.mp4'}"
-        shutil.copy(url, local)
+        # Same filesystem: a hardlink is a metadata-only op. Otherwise copyfile (sendfile on Linux)
+        try:
+            os.link(url, local)
+        except OSError:
+            shutil.copyfile(url, local)
         return str(local)
     raise FileNotFoundError(url)
 
 
-def download_many(urls: List[str], tmp_dir: str) -> List[str]:
-    return [download(u, tmp_dir) for u in urls]
+def download_many(urls: List[str], tmp_dir: str, max_workers: int = 16) -> List[str]:
+    """
+    Download/copy all urls concurrently; results keep the order of `urls`.
+    Downloads are latency-bound, so overlapping them cuts wall time to roughly the slowest one.
+    """
+    if len(urls) <= 1:
+        return [download(u, tmp_dir) for u in urls]
+    ensure_dir(tmp_dir)
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(urls))) as pool:
+        return list(pool.map(lambda u: download(u, tmp_dir), urls))
 
 
@@ -1,10 +1,15 @@
+import functools
 import os
+import re
+import shutil
 import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Optional, Tuple, List
+from typing import Callable, Optional, Tuple, List
 
 from .utils import ensure_dir
-from .vision import Segment
+from .vision import Segment, _ffmpeg_bin
 from .media import probe
 
 
@@ -16,31 +21,109 @@ def _run_ffmpeg(cmd: list[str]) -> None:
         raise RuntimeError(f"ffmpeg failed (code {proc.returncode}):\n{stderr_tail}")
 
 
-def _normalize_input(inp_path: str, out_path: str, fps: int = 30) -> str:
+# Resolved once at import instead of on every render
+_FFMPEG_BIN = _ffmpeg_bin()
+
+# Shared argv pieces, so every command spells them the same way
+_FF_PREAMBLE = ("-y", "-nostdin", "-hide_banner", "-loglevel", "error")
+_AAC_ARGS = ("-c:a", "aac", "-b:a", "192k")
+
+
+# Reels are short, so frame threading's pipeline fill is a large share of each encode; slices
+# split every frame across threads instead and keep the lookahead synchronous and short
+_X264_LOW_LATENCY = "sliced-threads=1:sync-lookahead=0:rc-lookahead=10"
+# High@4.0 covers 1080x1920@30 and lets mobile decoders set up without guessing from the stream
+_X264_ARGS = [
+    "-c:v", "libx264", "-preset", "veryfast", "-tune", "fastdecode",
+    "-profile:v", "high", "-level:v", "4.0", "-crf", "18", "-pix_fmt", "yuv420p",
+    "-x264-params", _X264_LOW_LATENCY,
+]
+# Intermediates that get decoded and re-encoded by a later filtergraph pass
+_SEGMENT_ENCODE = [
+    "-c:v", "libx264", "-preset", "ultrafast", "-crf", "23", "-pix_fmt", "yuv420p",
+    "-x264-params", _X264_LOW_LATENCY,
+]
+_NVENC_ARGS = ["-c:v", "h264_nvenc", "-preset", "p4", "-rc", "vbr", "-cq", "20", "-b:v", "0", "-pix_fmt", "yuv420p"]
+# Hardware H.264 encoders in probe order, with rate control roughly matching crf 18-20
+_HW_ENCODE_ARGS = {
+    "h264_nvenc": _NVENC_ARGS,
+    "h264_qsv": ["-c:v", "h264_qsv", "-preset", "veryfast", "-global_quality", "20", "-pix_fmt", "nv12"],
+    "h264_videotoolbox": ["-c:v", "h264_videotoolbox", "-b:v", "8M", "-pix_fmt", "yuv420p"],
+}
+# Final outputs: moov atom up front so playback can start before the whole file arrives. Sliced
+# threads stop scaling past ~8 slices per frame, so cap there
+_FINAL_OUT_ARGS = ["-movflags", "+faststart", "-threads", str(min(8, os.cpu_count() or 1))]
+# libx264 at 1080x1920 rarely keeps more than a handful of threads busy, so several capped
+# encoders side by side use the cores better than one uncapped encoder at a time
+_SEGMENT_THREADS = 4
+
+
+def _segment_pool(n_segments: int) -> Tuple[int, List[str]]:
+    """(max_workers, thread args) for encoding n_segments concurrently without oversubscribing."""
+    max_workers = max(1, min(n_segments, (os.cpu_count() or 1) // _SEGMENT_THREADS))
+    return max_workers, (["-threads", str(_SEGMENT_THREADS)] if max_workers > 1 else [])
+
+
+@functools.lru_cache(maxsize=None)
+def _detect_hw_encoder(ffmpeg_bin: str) -> Optional[str]:
+    """First hardware H.264 encoder this ffmpeg build lists (probed once per binary), else None."""
+    try:
+        proc = subprocess.run(
+            [ffmpeg_bin, "-hide_banner", "-encoders"],
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=15,
+        )
+    except Exception:
+        return None
+    for name in _HW_ENCODE_ARGS:
+        if name.encode() in proc.stdout:
+            return name
+    return None
+
+
+# Set after the first hardware run fails (e.g. NVENC compiled in but no GPU) so later renders skip straight to CPU
+_hw_failed = False
+# Consumer GPUs cap concurrent encode sessions; with several jobs and segments in flight, going over the cap
+# would fail a run and wrongly mark the encoder as unusable
+_hw_sessions = threading.BoundedSemaphore(int(os.environ.get("REELS_HW_SESSIONS", "2")))
+
+
+def _hw_encoder(ffmpeg_bin: str, hw: Optional[str]) -> Optional[str]:
+    """Hardware encoder to try for this render; None means libx264."""
+    if not hw or _hw_failed:
+        return None
+    return _detect_hw_encoder(ffmpeg_bin)
+
+
+def _video_codec_args(encoder: Optional[str], sw_args: List[str] = _X264_ARGS) -> List[str]:
+    return _HW_ENCODE_ARGS[encoder] if encoder else sw_args
+
+
+def _cuda_scale_vf(height: int) -> str:
+    """GPU scale, then download so the CPU crop/pad/fps chain can follow."""
+    return f"scale_cuda=-2:{height}:format=nv12,hwdownload,format=nv12,"
+
+
+# stderr markers of a hardware encoder/device failure, as opposed to a bad input or filtergraph
+_HW_ERROR_RE = re.compile(r"nvenc|cuda|qsv|videotoolbox|hwaccel|hwupload|hwdownload|device", re.IGNORECASE)
+
+
+def _run_ffmpeg_hw(build_cmd: Callable[[bool], List[str]], use_hw: bool) -> None:
     """
-    Re-encode input to a stable CFR H.264/AAC container to avoid filter issues.
+    Run build_cmd(True) when a hardware encoder is enabled, falling back to build_cmd(False).
+    The encoder probe can't tell whether the device is actually present, so device/encoder failures
+    retry on CPU and turn hardware off for later renders; any other failure is raised as is.
     """
-    ffmpeg_bin = os.environ.get("FFMPEG_BIN")
-    if not ffmpeg_bin:
+    global _hw_failed
+    if use_hw and not _hw_failed:
         try:
-            import imageio_ffmpeg  # type: ignore
-            ffmpeg_bin = imageio_ffmpeg.get_ffmpeg_exe()
-        except Exception:
-            ffmpeg_bin = "ffmpeg"
-
-    cmd = [
-        ffmpeg_bin,
-        "-y", "-nostdin", "-hide_banner", "-loglevel", "error",
-        "-i", inp_path,
-        "-r", str(fps), "-vsync", "cfr",
-        "-vf", "scale=trunc(iw/2)*2:trunc(ih/2)*2,format=yuv420p",
-        "-c:v", "libx264", "-preset", "veryfast", "-crf", "20",
-        "-c:a", "aac", "-ar", "48000", "-ac", "2",
-        "-movflags", "+faststart",
-        out_path,
-    ]
-    _run_ffmpeg(cmd)
-    return out_path
+            with _hw_sessions:
+                _run_ffmpeg(build_cmd(True))
+            return
+        except RuntimeError as e:
+            if not _HW_ERROR_RE.search(str(e)):
+                raise
+            _hw_failed = True
+    _run_ffmpeg(build_cmd(False))
 
 
 def _get_rotation_degrees(path: str) -> int:
@@ -74,6 +157,57 @@ def _rotation_prefix(path: str) -> str:
     return ""
 
 
+# Generic 9:16 fit after scale=-2:height: crop wide frames, pad narrow ones
+_CROP_PAD_FILTERS = [
+    ("crop", "w='if(gte(iw,1080),1080,iw)':h=1920:x='if(gte(iw,1080),(iw-1080)/2,0)'"),
+    ("pad", "1080:1920:(1080-iw)/2:0"),
+]
+_CROP_PAD_VF = ",".join(f"{name}={args}" for name, args in _CROP_PAD_FILTERS)
+
+
+def _fit_filters(path: str, height: int) -> List[Tuple[str, str]]:
+    """(filter, args) that bring the (already rotated) source to 1080x1920, picked from its probed size."""
+    try:
+        st0 = (probe(path).get("streams") or [{}])[0]
+        w, h = int(st0["width"]), int(st0["height"])
+    except Exception:
+        w = h = 0
+    if _get_rotation_degrees(path) % 180 == 90:
+        w, h = h, w
+    if w and h and w * 16 == h * 9:
+        # Already 9:16 (typical phone portrait): scale straight to the output, nothing to crop or pad
+        return [("scale", f"1080:{height}")]
+    return [("scale", f"-2:{height}"), *_CROP_PAD_FILTERS]
+
+
+def _fit_vf(path: str, height: int) -> str:
+    return ",".join(f"{name}={args}" for name, args in _fit_filters(path, height))
+
+
+def _write_concat_list(list_path: Path, paths: List[str]) -> None:
+    """ffconcat list with absolute paths, built in memory and written in one go."""
+    content = "ffconcat version 1.0\n" + "".join(f"file '{Path(p).resolve().as_posix()}'\n" for p in paths)
+    list_path.write_text(content, encoding="utf-8")
+
+
+def _extract_cover(ffmpeg_bin: str, src: str, cover_jpg: str, at: float = 1.0) -> None:
+    """Grab one frame of an already rendered 1080x1920 file as a high-quality JPEG; no filters needed."""
+    cover_cmd = [
+        ffmpeg_bin,
+        *_FF_PREAMBLE,
+        "-ss",
+        f"{at:.3f}",
+        "-i",
+        src,
+        "-frames:v",
+        "1",
+        "-q:v",
+        "2",
+        cover_jpg,
+    ]
+    _run_ffmpeg(cover_cmd)
+
+
 def center_crop_render(
     input_path: str,
     output_dir: str,
@@ -85,9 +219,12 @@ def center_crop_render(
     music_path: Optional[str] = None,
     music_gain_db: float = -8.0,
     duck_music: bool = True,
+    hw: Optional[str] = "cuda",
 ) -> Tuple[str, str]:
     """
     Minimal single-clip render: trim, center-crop to 9:16, scale to 1080x1920, loudnorm.
+    With hw set and a hardware H.264 encoder in this ffmpeg (NVENC, QSV or VideoToolbox), encode runs
+    on it; with NVENC, decode/scale run on the GPU too. hw=None forces libx264.
     Returns (video_path, cover_jpg)
     """
     ensure_dir(output_dir)
@@ -95,77 +232,77 @@ def center_crop_render(
     cover_jpg = str(Path(output_dir) / "cover.jpg")
 
     # Robust 9:16 with orientation fix: apply rotation if needed, scale to height, crop/pad
-    vf = (
-        _rotation_prefix(input_path) +
-        f"scale=-2:{height},"
-        "crop=w='if(gte(iw,1080),1080,iw)':h=1920:x='if(gte(iw,1080),(iw-1080)/2,0)',"
-        "pad=1080:1920:(1080-iw)/2:0,"
-        f"fps={fps}"
-    )
+    rot_prefix = _rotation_prefix(input_path)
+    # The GPU chain scales before we know the size, so it keeps the generic crop/pad
+    crop_vf = f"{_CROP_PAD_VF},fps={fps}"
+    vf = rot_prefix + _fit_vf(input_path, height) + f",fps={fps}"
     base_af = "loudnorm=I=-14:TP=-1.5:LRA=11, aresample=48000"
 
-    ffmpeg_bin = os.environ.get("FFMPEG_BIN")
-    if not ffmpeg_bin:
-        try:
-            import imageio_ffmpeg  # type: ignore
-            ffmpeg_bin = imageio_ffmpeg.get_ffmpeg_exe()
-        except Exception:
-            ffmpeg_bin = "ffmpeg"
-    if music_path:
-        # Build filter graph to mix program audio with music and optional ducking
-        afilters: List[str] = []
-        # Program audio
-        afilters.append("[0:a]aresample=48000, volume=1.0[a0]")
-        # Music audio (loop/trim to match requested duration)
-        afilters.append("[1:a]aresample=48000, volume={:.2f}dB[a1]".format(music_gain_db))
-        if duck_music:
-            afilters.append("[a1][a0]sidechaincompress=threshold=0.02:ratio=6:attack=5:release=300[a1d]")
-            mix_inputs = "[a0][a1d]"
-        else:
-            mix_inputs = "[a0][a1]"
-        afilters.append(f"{mix_inputs}amix=inputs=2:normalize=0:dropout_transition=0, {base_af}[am]")
+    ffmpeg_bin = _FFMPEG_BIN
+    hw_enc = _hw_encoder(ffmpeg_bin, hw)
+    # CUDA decode/scale pairs only with NVENC; rotated sources need transpose before scaling,
+    # which the GPU chain can't do
+    cuda_in = hw_enc == "h264_nvenc" and not rot_prefix
+
+    def _cmd(gpu: bool) -> List[str]:
+        hw_in = ["-hwaccel", "cuda", "-hwaccel_output_format", "cuda"] if gpu and cuda_in else []
+        vf_used = _cuda_scale_vf(height) + crop_vf if gpu and cuda_in else vf
+        vcodec = _video_codec_args(hw_enc if gpu else None)
+        # The explicit transpose replaces ffmpeg's own display-matrix autorotation
+        no_autorotate = ["-noautorotate"] if rot_prefix else []
+        if music_path:
+            # Build filter graph to mix program audio with music and optional ducking
+            afilters: List[str] = []
+            # Program audio
+            if duck_music:
+                # A filtergraph label feeds one input; split off the sidechain key
+                afilters.append("[0:a]aresample=48000, volume=1.0, asplit=2[a0][a0k]")
+            else:
+                afilters.append("[0:a]aresample=48000, volume=1.0[a0]")
+            # Music audio (loop/trim to match requested duration)
+            afilters.append("[1:a]aresample=48000, volume={:.2f}dB[a1]".format(music_gain_db))
+            if duck_music:
+                afilters.append("[a1][a0k]sidechaincompress=threshold=0.02:ratio=6:attack=5:release=300[a1d]")
+                mix_inputs = "[a0][a1d]"
+            else:
+                mix_inputs = "[a0][a1]"
+            afilters.append(f"{mix_inputs}amix=inputs=2:normalize=0:dropout_transition=0, {base_af}[am]")
 
-        cmd = [
-            ffmpeg_bin,
-            "-y","-nostdin","-hide_banner","-loglevel","error",
-            "-ss",
-            f"{t0:.3f}",
-            "-to",
-            f"{t1:.3f}",
-            "-i",
-            input_path,
-            "-stream_loop",
-            "-1",
-            "-t",
-            f"{(t1 - t0):.3f}",
-            "-i",
-            music_path,
-            "-vf",
-            vf,
-            "-filter_complex",
-            ";".join(afilters),
-            "-map",
-            "0:v:0",
-            "-map",
-            "[am]",
-            "-c:v",
-            "libx264",
-            "-preset",
-            "veryfast",
-            "-crf",
-            "18",
-            "-pix_fmt",
-            "yuv420p",
-            "-c:a",
-            "aac",
-            "-b:a",
-            "192k",
-            out_mp4,
-        ]
-    else:
-        cmd = [
+            return [
+                ffmpeg_bin,
+                *_FF_PREAMBLE,
+                *hw_in,
+                *no_autorotate,
+                "-ss",
+                f"{t0:.3f}",
+                "-to",
+                f"{t1:.3f}",
+                "-i",
+                input_path,
+                "-stream_loop",
+                "-1",
+                "-t",
+                f"{(t1 - t0):.3f}",
+                "-i",
+                music_path,
+                "-vf",
+                vf_used,
+                "-filter_complex",
+                ";".join(afilters),
+                "-map",
+                "0:v:0",
+                "-map",
+                "[am]",
+                *vcodec,
+                *_AAC_ARGS,
+                *_FINAL_OUT_ARGS,
+                out_mp4,
+            ]
+        return [
             ffmpeg_bin,
-            "-y","-nostdin","-hide_banner","-loglevel","error",
+            *_FF_PREAMBLE,
+            *hw_in,
+            *no_autorotate,
             "-ss",
             f"{t0:.3f}",
             "-to",
@@ -173,40 +310,20 @@ def center_crop_render(
             "-i",
             input_path,
             "-vf",
-            vf,
+            vf_used,
             "-af",
             base_af,
-            "-c:v",
-            "libx264",
-            "-preset",
-            "veryfast",
-            "-crf",
-            "18",
-            "-pix_fmt",
-            "yuv420p",
-            "-c:a",
-            "aac",
-            "-b:a",
-            "192k",
+            *vcodec,
+            *_AAC_ARGS,
+            *_FINAL_OUT_ARGS,
             out_mp4,
         ]
-    _run_ffmpeg(cmd)
 
-    # Extract cover from 1s into the clip
-    cover_cmd = [
-        ffmpeg_bin,
-        "-y","-nostdin","-hide_banner","-loglevel","error",
-        "-ss",
-        f"{t0 + 1.0:.3f}",
-        "-i",
-        input_path,
-        "-vframes",
-        "1",
-        "-vf",
-        vf,
-        cover_jpg,
-    ]
-    _run_ffmpeg(cover_cmd)
+    _run_ffmpeg_hw(_cmd, hw_enc is not None)
+
+    # Extract cover from 1s into the clip. The render is already rotated/cropped 1080p, so grabbing
+    # it there skips re-decoding the (often larger) source through the whole filter chain
+    _extract_cover(ffmpeg_bin, out_mp4, cover_jpg, at=min(1.0, (t1 - t0) / 2))
 
     return out_mp4, cover_jpg
 
@@ -222,73 +339,137 @@ def concat_center_crop_render(
     music_path: Optional[str] = None,
     music_gain_db: float = -8.0,
     duck_music: bool = True,
+    hw: Optional[str] = "cuda",
 ) -> Tuple[str, str]:
     """
     Minimal concat of multiple inputs: pre-trim not applied; center-crop/scale each, concat.
+    With hw set and a hardware H.264 encoder available, encodes run on it; with NVENC, segments
+    are also scaled on the GPU.
     """
     ensure_dir(output_dir)
-    ffmpeg_bin = os.environ.get("FFMPEG_BIN")
-    if not ffmpeg_bin:
+    ffmpeg_bin = _FFMPEG_BIN
+    hw_enc = _hw_encoder(ffmpeg_bin, hw)
+    out_mp4 = str(Path(output_dir) / "reel_1080x1920.mp4")
+    cover_jpg = str(Path(output_dir) / "cover.jpg")
+    crop_vf = f"{_CROP_PAD_VF},fps={fps}"
+    total_len = len(inputs) * per_segment_sec - max(len(inputs) - 1, 0) * (crossfade_sec or 0.0)
+
+    def _add_music(args: List[str], filt_parts: List[str], music_idx: int, a_prog: str) -> str:
+        """Append the looped music input and its mix with [a_prog]; returns the mixed label."""
+        args += ["-stream_loop", "-1", "-t", f"{total_len:.3f}", "-i", music_path]
+        filt_parts.append(f"[{music_idx}:a]aresample=48000, volume={music_gain_db:.2f}dB[amusic]")
+        if duck_music:
+            # The program audio feeds both the sidechain and the mix, so split it
+            filt_parts.append(f"[{a_prog}]asplit=2[aprog][akey]")
+            filt_parts.append("[amusic][akey]sidechaincompress=threshold=0.02:ratio=6:attack=5:release=300[amusicd]")
+            mix_in = "[aprog][amusicd]"
+        else:
+            mix_in = f"[{a_prog}][amusic]"
+        filt_parts.append(mix_in + "amix=inputs=2:normalize=0:dropout_transition=0, aresample=48000[am]")
+        return "am"
+
+    def _run_filtergraph(args: List[str], filt_parts: List[str], v_out: str, a_out: str) -> None:
+        cmd_fg = args + [
+            "-filter_complex",
+            ";".join(filt_parts),
+            "-map",
+            f"[{v_out}]",
+            "-map",
+            f"[{a_out}]",
+        ]
+        tail_fg = [
+            *_AAC_ARGS,
+            *_FINAL_OUT_ARGS,
+            out_mp4,
+        ]
+        _run_ffmpeg_hw(lambda gpu: cmd_fg + _video_codec_args(hw_enc if gpu else None) + tail_fg, hw_enc is not None)
+
+    if crossfade_sec and len(inputs) > 1:
+        # Crossfades re-encode everything anyway: trim/scale/crop each raw input inside one
+        # filtergraph and encode once, with no segment files on disk
+        args_fg = [ffmpeg_bin, *_FF_PREAMBLE]
+        filt_parts: List[str] = []
+        for idx, inp in enumerate(inputs):
+            rot_prefix = _rotation_prefix(inp)
+            # The explicit transpose replaces ffmpeg's own display-matrix autorotation
+            args_fg += [*(["-noautorotate"] if rot_prefix else []), "-i", inp]
+            filt_parts.append(
+                f"[{idx}:v]{rot_prefix}{_fit_vf(inp, height)},fps={fps},"
+                f"trim=0:{per_segment_sec:.3f},setpts=PTS-STARTPTS,fps={fps},format=yuv420p,setsar=1[v{idx}]"
+            )
+            filt_parts.append(
+                f"[{idx}:a]atrim=0:{per_segment_sec:.3f},asetpts=PTS-STARTPTS,"
+                "loudnorm=I=-14:TP=-1.5:LRA=11,aresample=48000,"
+                f"aformat=sample_fmts=fltp:channel_layouts=stereo[a{idx}]"
+            )
+        prev_v, prev_a = "v0", "a0"
+        for idx in range(1, len(inputs)):
+            off = max(idx * (per_segment_sec - crossfade_sec), 0.0)
+            filt_parts.append(
+                f"[{prev_v}][v{idx}]xfade=transition=fade:duration={crossfade_sec:.3f}:offset={off:.3f}[vx{idx}]"
+            )
+            filt_parts.append(f"[{prev_a}][a{idx}]acrossfade=d={crossfade_sec:.3f}[ax{idx}]")
+            prev_v, prev_a = f"vx{idx}", f"ax{idx}"
+        a_out = _add_music(args_fg, filt_parts, len(inputs), prev_a) if music_path else prev_a
         try:
-            import imageio_ffmpeg  # type: ignore
-            ffmpeg_bin = imageio_ffmpeg.get_ffmpeg_exe()
-        except Exception:
-            ffmpeg_bin = "ffmpeg"
+            _run_filtergraph(args_fg, filt_parts, prev_v, a_out)
+        except RuntimeError:
+            # e.g. an input without an audio stream; the per-segment path pads those with silence
+            pass
+        else:
+            _extract_cover(ffmpeg_bin, out_mp4, cover_jpg)
+            return out_mp4, cover_jpg
 
     # Safer approach: pre-render each segment with uniform params, then concat demuxer
     seg_dir = Path(output_dir) / "segments"
     ensure_dir(seg_dir)
-    seg_paths: List[str] = []
-    for idx, inp in enumerate(inputs):
-        # Normalize source first
-        norm_inp = str(seg_dir / f"norm_{idx:02d}.mp4")
-        try:
-            _normalize_input(inp, norm_inp, fps=fps)
-            source = norm_inp
-        except Exception:
-            source = inp
-
+    # Segments render concurrently; cap each ffmpeg's threads so they don't oversubscribe the cores
+    max_workers, seg_threads = _segment_pool(len(inputs))
+    # Segments are only intermediates when the xfade filtergraph re-encodes them;
+    # the concat demuxer stream-copies them into the final file otherwise
+    reencoded = bool(crossfade_sec and len(inputs) > 1)
+    seg_x264 = _SEGMENT_ENCODE if reencoded else _X264_ARGS
+
+    def _render_segment(idx: int, inp: str) -> str:
+        # One pass straight from the raw input; genpts/ignore_err tolerate the sloppy
+        # containers a separate normalize pass used to clean up
         seg_out = str(seg_dir / f"seg_{idx:02d}.mp4")
-        vf = (
-            _rotation_prefix(source) +
-            f"scale=-2:{height},"
-            "crop=w='if(gte(iw,1080),1080,iw)':h=1920:x='if(gte(iw,1080),(iw-1080)/2,0)',"
-            "pad=1080:1920:(1080-iw)/2:0,"
-            f"fps={fps}"
-        )
+        rot_prefix = _rotation_prefix(inp)
+        # Rotated sources need transpose before scaling, which the GPU chain can't do
+        cuda_in = hw_enc == "h264_nvenc" and not rot_prefix
+        vf = rot_prefix + _fit_vf(inp, height) + f",fps={fps}"
         af = "loudnorm=I=-14:TP=-1.5:LRA=11, aresample=48000, asetpts=PTS-STARTPTS"
-        cmd_seg = [
-            ffmpeg_bin,
-            "-y","-nostdin","-hide_banner","-loglevel","error",
-            "-i",
-            source,
-            "-t",
-            f"{per_segment_sec:.3f}",
-            "-vf",
-            vf,
-            "-af",
-            af,
-            "-c:v",
-            "libx264",
-            "-preset",
-            "veryfast",
-            "-crf",
-            "18",
-            "-pix_fmt",
-            "yuv420p",
-            "-c:a",
-            "aac",
-            "-b:a",
-            "192k",
-            seg_out,
-        ]
+
+        def _cmd_seg(gpu: bool) -> List[str]:
+            return [
+                ffmpeg_bin,
+                *_FF_PREAMBLE,
+                *(["-hwaccel", "cuda", "-hwaccel_output_format", "cuda"] if gpu and cuda_in else []),
+                "-fflags", "+genpts",
+                "-err_detect", "ignore_err",
+                # The explicit transpose replaces ffmpeg's own display-matrix autorotation
+                *(["-noautorotate"] if rot_prefix else []),
+                "-i",
+                inp,
+                "-t",
+                f"{per_segment_sec:.3f}",
+                "-vf",
+                _cuda_scale_vf(height) + crop_vf if gpu and cuda_in else vf,
+                "-af",
+                af,
+                *_video_codec_args(hw_enc if gpu else None, seg_x264),
+                *_AAC_ARGS,
+                *seg_threads,
+                seg_out,
+            ]
         try:
-            _run_ffmpeg(cmd_seg)
-        except subprocess.CalledProcessError:
+            _run_ffmpeg_hw(_cmd_seg, hw_enc is not None)
+        except RuntimeError:
             # Fallback for inputs without audio: generate silent audio and map it
-            cmd_seg_silent = [
+            cmd_seg_silent = lambda gpu: [
                 ffmpeg_bin,
-                "-y","-nostdin","-hide_banner","-loglevel","error",
+                *_FF_PREAMBLE,
+                *(["-noautorotate"] if rot_prefix else []),
                 "-i",
                 inp,
                 "-f", "lavfi", "-i", "anullsrc=channel_layout=stereo:sample_rate=48000",
@@ -297,44 +478,36 @@ def concat_center_crop_render(
                 "-filter_complex", f"[0:v]{vf}[v]",
                 "-map", "[v]",
                 "-map", "1:a:0",
-                "-c:v",
-                "libx264",
-                "-preset",
-                "veryfast",
-                "-crf",
-                "18",
-                "-pix_fmt",
-                "yuv420p",
-                "-c:a",
-                "aac",
-                "-b:a",
-                "192k",
+                *_video_codec_args(hw_enc if gpu else None, seg_x264),
+                *_AAC_ARGS,
+                *seg_threads,
                 seg_out,
             ]
-            _run_ffmpeg(cmd_seg_silent)
-        seg_paths.append(seg_out)
+            _run_ffmpeg_hw(cmd_seg_silent, hw_enc is not None)
+        return seg_out
 
-    # If crossfade requested, build filtergraph chain with xfade/acrossfade
-    out_mp4 = str(Path(output_dir) / "reel_1080x1920.mp4")
-    cover_jpg = str(Path(output_dir) / "cover.jpg")
+    try:
+        # map() keeps results in input order
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            seg_paths: List[str] = list(pool.map(_render_segment, range(len(inputs)), inputs))
 
-    if (crossfade_sec and len(seg_paths) > 1) or music_path:
-        args_fg = [ffmpeg_bin, "-y"]
-        for p in seg_paths:
-            args_fg += ["-i", p]
+        # Crossfades need a filtergraph over the segments (only reached when the direct graph failed)
+        if crossfade_sec and len(seg_paths) > 1:
+            args_fg = [ffmpeg_bin, *_FF_PREAMBLE]
+            for p in seg_paths:
+                args_fg += ["-i", p]
 
-        filt_parts: List[str] = []
-        # Prepare labeled streams with consistent fps/format and reset PTS
-        for idx in range(len(seg_paths)):
-            filt_parts.append(
-                f"[{idx}:v]fps={fps},format=yuv420p,setpts=PTS-STARTPTS[v{idx}]"
-            )
-            filt_parts.append(
-                f"[{idx}:a]aresample=48000,aformat=sample_fmts=fltp:channel_layouts=stereo,asetpts=PTS-STARTPTS[a{idx}]"
-            )
+            filt_parts: List[str] = []
+            # Prepare labeled streams with consistent fps/format and reset PTS
+            for idx in range(len(seg_paths)):
+                # fps after setpts: xfade needs a constant frame rate on its inputs
+                filt_parts.append(
+                    f"[{idx}:v]setpts=PTS-STARTPTS,fps={fps},format=yuv420p[v{idx}]"
+                )
+                filt_parts.append(
+                    f"[{idx}:a]aresample=48000,aformat=sample_fmts=fltp:channel_layouts=stereo,asetpts=PTS-STARTPTS[a{idx}]"
+                )
 
-        # Build program A/V either via xfade chain or concat filter
-        if crossfade_sec and len(seg_paths) > 1:
             prev_v = "v0"
             prev_a = "a0"
             cum = per_segment_sec  # current composite duration
@@ -350,128 +523,66 @@ def concat_center_crop_render(
                 )
                 prev_v, prev_a = out_v, out_a
                 cum = cum + per_segment_sec - crossfade_sec
-            v_final = prev_v
-            a_prog = prev_a
-        else:
-            # Concat N segments to [vc][ac]
-            maps = "".join([f"[v{i}][a{i}]" for i in range(len(seg_paths))])
-            filt_parts.append(
-                maps + f"concat=n={len(seg_paths)}:v=1:a=1[vc][ac]"
-            )
-            v_final = "vc"
-            a_prog = "ac"
-
-        # Optional background music mixing
-        if music_path:
-            total_len = len(seg_paths) * per_segment_sec - max(len(seg_paths) - 1, 0) * (crossfade_sec or 0.0)
-            args_fg += ["-stream_loop", "-1", "-t", f"{total_len:.3f}", "-i", music_path]
-            music_idx = len(seg_paths)
-            filt_parts.append(f"[{music_idx}:a]aresample=48000, volume={music_gain_db:.2f}dB[amusic]")
-            if duck_music:
-                filt_parts.append(f"[amusic][{a_prog}]sidechaincompress=threshold=0.02:ratio=6:attack=5:release=300[amusicd]")
-                mix_in = f"[{a_prog}][amusicd]"
-            else:
-                mix_in = f"[{a_prog}][amusic]"
-            filt_parts.append(mix_in + "amix=inputs=2:normalize=0:dropout_transition=0, aresample=48000[am]")
-            a_out = "am"
-        else:
-            a_out = a_prog
-
-        filter_complex = ";".join(filt_parts)
-        cmd_fg = args_fg + [
-            "-filter_complex",
-            filter_complex,
-            "-map",
-            f"[{v_final}]",
-            "-map",
-            f"[{a_out}]",
-            "-c:v",
-            "libx264",
-            "-preset",
-            "veryfast",
-            "-crf",
-            "18",
-            "-pix_fmt",
-            "yuv420p",
-            "-c:a",
-            "aac",
-            "-b:a",
-            "192k",
-            out_mp4,
-        ]
-        _run_ffmpeg(cmd_fg)
 
-    else:
-        # Create concat list file (ffconcat format with absolute paths)
-        list_path = Path(output_dir) / "concat.txt"
-        with open(list_path, "w", encoding="utf-8") as f:
-            f.write("ffconcat version 1.0\n")
-            for p in seg_paths:
-                f.write(f"file '{Path(p).resolve().as_posix()}'\n")
+            # Optional background music mixing
+            a_out = _add_music(args_fg, filt_parts, len(seg_paths), prev_a) if music_path else prev_a
+            _run_filtergraph(args_fg, filt_parts, prev_v, a_out)
 
-        # Concat without re-encode to keep speed (codecs/params match)
-        cmd_concat = [
-            ffmpeg_bin,
-            "-y",
-            "-f",
-            "concat",
-            "-safe",
-            "0",
-            "-i",
-            str(list_path),
-            "-c",
-            "copy",
-            out_mp4,
-        ]
-        try:
-            _run_ffmpeg(cmd_concat)
-        except subprocess.CalledProcessError:
-            # Fallback: re-encode on concat if stream copy fails
+        else:
+            # Create concat list file (ffconcat format with absolute paths); it lives with the
+            # segments so the cleanup below removes it too
+            list_path = seg_dir / "concat.txt"
+            _write_concat_list(list_path, seg_paths)
+
+            # With music, the video is concatenated to a scratch file and only the audio is remixed after
+            concat_out = str(seg_dir / "concat.mp4") if music_path else out_mp4
+            # Concat without re-encode to keep speed (codecs/params match)
             cmd_concat = [
                 ffmpeg_bin,
-                "-y","-nostdin","-hide_banner","-loglevel","error",
+                *_FF_PREAMBLE,
                 "-f",
                 "concat",
                 "-safe",
                 "0",
                 "-i",
                 str(list_path),
-                "-c:v",
-                "libx264",
-                "-preset",
-                "veryfast",
-                "-crf",
-                "18",
-                "-pix_fmt",
-                "yuv420p",
-                "-c:a",
-                "aac",
-                "-b:a",
-                "192k",
-                out_mp4,
+                "-c",
+                "copy",
+                "-movflags",
+                "+faststart",
+                concat_out,
             ]
-            _run_ffmpeg(cmd_concat)
-    list_path = Path(output_dir) / "concat.txt"
-    with open(list_path, "w", encoding="utf-8") as f:
-        f.write("ffconcat version 1.0\n")
-        for p in seg_paths:
-            f.write(f"file '{Path(p).resolve().as_posix()}'\n")
-
-    cover_jpg = str(Path(output_dir) / "cover.jpg")
+            try:
+                _run_ffmpeg(cmd_concat)
+            except RuntimeError:
+                # Fallback: re-encode on concat if stream copy fails
+                cmd_reencode = lambda gpu: [
+                    ffmpeg_bin,
+                    *_FF_PREAMBLE,
+                    "-f",
+                    "concat",
+                    "-safe",
+                    "0",
+                    "-i",
+                    str(list_path),
+                    *_video_codec_args(hw_enc if gpu else None),
+                    *_AAC_ARGS,
+                    *_FINAL_OUT_ARGS,
+                    concat_out,
+                ]
+                _run_ffmpeg_hw(cmd_reencode, hw_enc is not None)
+
+            if music_path:
+                # Audio-only mix on top of the stream-copied video
+                out_mp4 = add_music_overlay(
+                    concat_out, output_dir, music_path, music_gain_db=music_gain_db, duck_music=duck_music
+                )
 
-    # Extract cover from first segment
-    cover_cmd = [
-        ffmpeg_bin,
-        "-y","-nostdin","-hide_banner","-loglevel","error",
-        "-ss",
-        "1.0",
-        "-i",
-        seg_paths[0],
-        "-vframes",
-        "1",
-        cover_jpg,
-    ]
-    _run_ffmpeg(cover_cmd)
+        # Extract cover from the first segment, or from the output when crossfades reshaped it
+        _extract_cover(ffmpeg_bin, out_mp4 if (crossfade_sec and len(seg_paths) > 1) else seg_paths[0], cover_jpg)
+    finally:
+        # Segments are only inputs to the concat and cover; don't leave them (or partial ones) behind
+        shutil.rmtree(seg_dir, ignore_errors=True)
 
     return out_mp4, cover_jpg
 
@@ -489,13 +600,7 @@ def add_music_overlay(
     Returns new video path.
     """
     ensure_dir(output_dir)
-    ffmpeg_bin = os.environ.get("FFMPEG_BIN")
-    if not ffmpeg_bin:
-        try:
-            import imageio_ffmpeg  # type: ignore
-            ffmpeg_bin = imageio_ffmpeg.get_ffmpeg_exe()
-        except Exception:
-            ffmpeg_bin = "ffmpeg"
+    ffmpeg_bin = _FFMPEG_BIN
 
     # Ensure we don't write to the same file as the input
     default_out = Path(output_dir) / "reel_1080x1920.mp4"
@@ -515,8 +620,10 @@ def add_music_overlay(
         afilters.append("[0:a]aresample=48000,volume=1.0[a0]")
         afilters.append(f"[1:a]aresample=48000,volume={music_gain_db:.2f}dB[a1]")
         if duck_music:
-            afilters.append("[a1][a0]sidechaincompress=threshold=0.02:ratio=6:attack=5:release=300[a1d]")
-            mix_inputs = "[a0][a1d]"
+            # The program audio feeds both the sidechain and the mix, so split it
+            afilters.append("[a0]asplit=2[a0m][a0k]")
+            afilters.append("[a1][a0k]sidechaincompress=threshold=0.02:ratio=6:attack=5:release=300[a1d]")
+            mix_inputs = "[a0m][a1d]"
         else:
             mix_inputs = "[a0][a1]"
         afilters.append(mix_inputs + "amix=inputs=2:normalize=0:dropout_transition=0,aresample=48000[am]")
@@ -524,7 +631,7 @@ def add_music_overlay(
 
     cmd = [
         ffmpeg_bin,
-        "-y", "-nostdin", "-hide_banner", "-loglevel", "error",
+        *_FF_PREAMBLE,
         "-i", input_video_path,
         "-stream_loop", "-1",
         "-i", music_path,
@@ -533,7 +640,8 @@ def add_music_overlay(
         "-map", amap,
         "-c:v", "copy",
         "-shortest",
-        "-c:a", "aac", "-b:a", "192k",
+        *_AAC_ARGS,
+        "-movflags", "+faststart",
         out_mp4,
     ]
     _run_ffmpeg(cmd)
@@ -546,65 +654,60 @@ def concat_segments_render(
     width: int = 1080,
     height: int = 1920,
     fps: int = 30,
+    hw: Optional[str] = "cuda",
 ) -> Tuple[str, str]:
     """
     Trim arbitrary [t0,t1] from possibly different sources, center-crop to 9:16, then concat.
+    Encodes use a hardware H.264 encoder when hw is set and one is available.
     """
     ensure_dir(output_dir)
-    ffmpeg_bin = os.environ.get("FFMPEG_BIN")
-    if not ffmpeg_bin:
-        try:
-            import imageio_ffmpeg  # type: ignore
-            ffmpeg_bin = imageio_ffmpeg.get_ffmpeg_exe()
-        except Exception:
-            ffmpeg_bin = "ffmpeg"
+    ffmpeg_bin = _FFMPEG_BIN
+    hw_enc = _hw_encoder(ffmpeg_bin, hw)
 
     seg_dir = Path(output_dir) / "segments"
     ensure_dir(seg_dir)
-    seg_paths: List[str] = []
-
-    vf = (
-        f"scale=-2:{height},"
-        "crop=w='if(gte(iw,1080),1080,iw)':h=1920:x='if(gte(iw,1080),(iw-1080)/2,0)',"
-        "pad=1080:1920:(1080-iw)/2:0,"
-        f"fps={fps}"
-    )
-    for idx, seg in enumerate(segments):
+    max_workers, seg_threads = _segment_pool(len(segments))
+
+    def _encode_one_segment(idx: int, seg: Segment) -> str:
         out = str(seg_dir / f"seg_{idx:02d}.mp4")
         rot_prefix = _rotation_prefix(seg.path)
-        vf_seg = rot_prefix + vf
+        vf_seg = rot_prefix + _fit_vf(seg.path, height) + f",fps={fps}"
         # Add a short fade-out on the last segment for smoother ending
         if idx == len(segments) - 1:
             dur = max(0.5, seg.t1 - seg.t0)
             fade_d = min(0.7, dur / 2)
             vf_seg = vf_seg + f",fade=t=out:st={max(dur - fade_d, 0):.3f}:d={fade_d:.3f}"
-        cmd = [
+        cmd = lambda gpu: [
             ffmpeg_bin,
-            "-y", "-nostdin", "-hide_banner", "-loglevel", "error",
+            *_FF_PREAMBLE,
+            # The explicit transpose replaces ffmpeg's own display-matrix autorotation
+            *(["-noautorotate"] if rot_prefix else []),
             "-ss", f"{seg.t0:.3f}",
             "-to", f"{seg.t1:.3f}",
             "-i", seg.path,
             "-vf", vf_seg,
             "-af", "aresample=48000",
-            "-c:v", "libx264", "-preset", "veryfast", "-crf", "18", "-pix_fmt", "yuv420p",
-            "-c:a", "aac", "-b:a", "192k",
+            *_video_codec_args(hw_enc if gpu else None),
+            *_AAC_ARGS,
+            *seg_threads,
             out,
         ]
-        _run_ffmpeg(cmd)
-        seg_paths.append(out)
+        _run_ffmpeg_hw(cmd, hw_enc is not None)
+        return out
+
+    # map() keeps results in segment order
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        seg_paths: List[str] = list(pool.map(_encode_one_segment, range(len(segments)), segments))
 
     # concat list
     list_path = Path(output_dir) / "concat.txt"
-    with open(list_path, "w", encoding="utf-8") as f:
-        f.write("ffconcat version 1.0\n")
-        for p in seg_paths:
-            f.write(f"file '{Path(p).resolve().as_posix()}'\n")
+    _write_concat_list(list_path, seg_paths)
 
     out_mp4 = str(Path(output_dir) / "reel_1080x1920.mp4")
     cover_jpg = str(Path(output_dir) / "cover.jpg")
     cmd_concat = [
         ffmpeg_bin,
-        "-y", "-nostdin", "-hide_banner", "-loglevel", "error",
+        *_FF_PREAMBLE,
         "-f", "concat", "-safe", "0",
         "-i", str(list_path),
         "-c", "copy",
@@ -613,23 +716,19 @@ def concat_segments_render(
     try:
         _run_ffmpeg(cmd_concat)
     except Exception:
-        cmd_concat = [
+        cmd_reencode = lambda gpu: [
             ffmpeg_bin,
-            "-y", "-nostdin", "-hide_banner", "-loglevel", "error",
+            *_FF_PREAMBLE,
             "-f", "concat", "-safe", "0",
             "-i", str(list_path),
-            "-c:v", "libx264", "-preset", "veryfast", "-crf", "18", "-pix_fmt", "yuv420p",
-            "-c:a", "aac", "-b:a", "192k",
+            *_video_codec_args(hw_enc if gpu else None),
+            *_AAC_ARGS,
             out_mp4,
         ]
-        _run_ffmpeg(cmd_concat)
+        _run_ffmpeg_hw(cmd_reencode, hw_enc is not None)
 
     # cover from first segment
-    cover_cmd = [
-        ffmpeg_bin, "-y", "-nostdin", "-hide_banner", "-loglevel", "error",
-        "-ss", "0.5", "-i", seg_paths[0], "-vframes", "1", cover_jpg,
-    ]
-    _run_ffmpeg(cover_cmd)
+    _extract_cover(ffmpeg_bin, seg_paths[0], cover_jpg, at=0.5)
     return out_mp4, cover_jpg
 
 
@@ -0,0 +1,272 @@
+"""
+In-process renders on PyAV (libavformat/libavfilter/libavcodec bindings).
+
+Same output as render.center_crop_render / render.concat_segments_render, without fork/exec-ing
+ffmpeg or re-parsing the filtergraph in a fresh process per job; montages keep one encoder open
+across every segment instead of writing segment files and concatenating them. Encoding here is
+always libx264, so renders go through the subprocess renderer when hw is set and ffmpeg has a
+hardware H.264 encoder; also when av is not installed, when music has to be mixed in, or when the
+in-process render fails.
+"""
+import logging
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from .utils import ensure_dir
+from .vision import Segment
+from . import render as _render
+
+try:
+    import av  # type: ignore
+except Exception:
+    av = None  # type: ignore
+
+logger = logging.getLogger(__name__)
+
+# Matches render._X264_ARGS
+_X264_OPTIONS = {
+    "preset": "veryfast", "tune": "fastdecode", "profile": "high", "level": "4.0", "crf": "18",
+    "x264-params": _render._X264_LOW_LATENCY,
+}
+
+
+def _video_filters(input_path: str, height: int, fps: int) -> List[Tuple[str, str]]:
+    """(filter, args) chain matching center_crop_render's -vf, plus the yuv420p conversion."""
+    chain: List[Tuple[str, str]] = []
+    rot = _render._rotation_prefix(input_path)
+    if rot == "hflip,vflip,":
+        chain += [("hflip", ""), ("vflip", "")]
+    elif rot:
+        chain.append(("transpose", rot[len("transpose="):-1]))
+    chain += [
+        *_render._fit_filters(input_path, height),
+        ("fps", str(fps)),
+        ("format", "yuv420p"),
+    ]
+    return chain
+
+
+def _build_graph(src_stream, chain: List[Tuple[str, str]], audio: bool):
+    graph = av.filter.Graph()
+    nodes = [graph.add_abuffer(template=src_stream) if audio else graph.add_buffer(template=src_stream)]
+    for name, args in chain:
+        nodes.append(graph.add(name, args) if args else graph.add(name))
+    nodes.append(graph.add("abuffersink" if audio else "buffersink"))
+    graph.link_nodes(*nodes).configure()
+    return graph
+
+
+def _drain(graph, stream, out, last_pts: Optional[Dict[int, int]] = None) -> None:
+    """
+    Encode and mux whatever the graph has ready. With last_pts (output stream index -> last pts),
+    frames that don't move past the previous one are dropped: consecutive segment graphs can each
+    round a frame onto the same boundary timestamp.
+    """
+    while True:
+        try:
+            frame = graph.pull()
+        except (av.BlockingIOError, av.EOFError):
+            return
+        if last_pts is not None:
+            if frame.pts <= last_pts.get(stream.index, -1):
+                continue
+            last_pts[stream.index] = frame.pts
+        for packet in stream.encode(frame):
+            out.mux(packet)
+
+
+def _add_output_streams(out, width: int, height: int, fps: int, audio: bool):
+    vout = out.add_stream("libx264", rate=fps, options=dict(_X264_OPTIONS))
+    vout.width = width
+    vout.height = height
+    vout.pix_fmt = "yuv420p"
+    aout = None
+    if audio:
+        aout = out.add_stream("aac", rate=48000, layout="stereo")
+        aout.bit_rate = 192_000
+    return vout, aout
+
+
+def _flush(graph, stream, out, last_pts: Optional[Dict[int, int]] = None) -> None:
+    """Drain what the graph still holds after EOF (the encoder itself is flushed separately)."""
+    graph.push(None)
+    _drain(graph, stream, out, last_pts)
+
+
+def _flush_encoder(stream, out) -> None:
+    for packet in stream.encode(None):
+        out.mux(packet)
+
+
+def _render_av(input_path: str, out_mp4: str, t0: float, t1: float, width: int, height: int, fps: int) -> None:
+    with av.open(input_path) as src:
+        vin = src.streams.video[0]
+        ain = src.streams.audio[0] if src.streams.audio else None
+        vin.thread_type = "AUTO"
+
+        vgraph = _build_graph(vin, _video_filters(input_path, height, fps), audio=False)
+        agraph = None
+        if ain is not None:
+            agraph = _build_graph(ain, [("loudnorm", "I=-14:TP=-1.5:LRA=11"), ("aresample", "48000")], audio=True)
+
+        with av.open(out_mp4, mode="w", options={"movflags": "+faststart"}) as out:
+            vout, aout = _add_output_streams(out, width, height, fps, audio=ain is not None)
+
+            if t0 > 0:
+                src.seek(int(t0 / vin.time_base), stream=vin)
+            streams = [s for s in (vin, ain) if s is not None]
+            done = set()
+            for packet in src.demux(*streams):
+                for frame in packet.decode():
+                    if frame.time is None or frame.time < t0:
+                        continue
+                    if frame.time >= t1:
+                        # Past the end on this stream; the other may still be catching up
+                        done.add(packet.stream.index)
+                        continue
+                    # Rebase timestamps so the clip starts at zero, like -ss/-to on the input
+                    frame.pts -= int(round(t0 / frame.time_base))
+                    if packet.stream is vin:
+                        vgraph.push(frame)
+                        _drain(vgraph, vout, out)
+                    else:
+                        agraph.push(frame)
+                        _drain(agraph, aout, out)
+                if len(done) == len(streams):
+                    # Every stream is past t1; don't decode the rest of the source
+                    break
+
+            _flush(vgraph, vout, out)
+            _flush_encoder(vout, out)
+            if agraph is not None:
+                _flush(agraph, aout, out)
+                _flush_encoder(aout, out)
+
+
+def _concat_segments_av(segments: List[Segment], out_mp4: str, width: int, height: int, fps: int) -> None:
+    with av.open(out_mp4, mode="w", options={"movflags": "+faststart"}) as out:
+        vout, aout = _add_output_streams(out, width, height, fps, audio=True)
+        offset = 0.0  # where the current segment starts in the output timeline
+        last_pts: Dict[int, int] = {}
+        for idx, seg in enumerate(segments):
+            dur = seg.t1 - seg.t0
+            with av.open(seg.path) as src:
+                vin = src.streams.video[0]
+                ain = src.streams.audio[0] if src.streams.audio else None
+                if ain is None:
+                    # The aac track has to run through every segment
+                    raise RuntimeError(f"no audio stream in {seg.path}")
+                vin.thread_type = "AUTO"
+
+                vchain = _video_filters(seg.path, height, fps)
+                if idx == len(segments) - 1:
+                    # Short fade-out on the last segment for a smoother ending, as in concat_segments_render
+                    fade_d = min(0.7, max(0.5, dur) / 2)
+                    vchain.insert(-1, ("fade", f"t=out:st={offset + max(dur - fade_d, 0):.3f}:d={fade_d:.3f}"))
+                # Fresh graphs per segment: sources differ in size, rotation and sample format
+                vgraph = _build_graph(vin, vchain, audio=False)
+                agraph = _build_graph(
+                    ain, [("aresample", "48000"), ("aformat", "sample_fmts=fltp:channel_layouts=stereo")], audio=True
+                )
+
+                if seg.t0 > 0:
+                    src.seek(int(seg.t0 / vin.time_base), stream=vin)
+                done = set()
+                for packet in src.demux(vin, ain):
+                    for frame in packet.decode():
+                        if frame.time is None or frame.time < seg.t0:
+                            continue
+                        if frame.time >= seg.t1:
+                            done.add(packet.stream.index)
+                            continue
+                        # Shift onto the output timeline right after the previous segment
+                        frame.pts += int(round((offset - seg.t0) / frame.time_base))
+                        if packet.stream is vin:
+                            vgraph.push(frame)
+                            _drain(vgraph, vout, out, last_pts)
+                        else:
+                            agraph.push(frame)
+                            _drain(agraph, aout, out, last_pts)
+                    if len(done) == 2:
+                        # Both streams are past t1; don't decode the rest of the source
+                        break
+                _flush(vgraph, vout, out, last_pts)
+                _flush(agraph, aout, out, last_pts)
+            offset += dur
+        _flush_encoder(vout, out)
+        _flush_encoder(aout, out)
+
+
+def _extract_cover(video_path: str, cover_jpg: str, at: float = 1.0) -> None:
+    with av.open(video_path) as src:
+        last = None
+        for frame in src.decode(video=0):
+            last = frame
+            if frame.time is not None and frame.time >= at:
+                break
+        if last is None:
+            raise RuntimeError(f"no video frames in {video_path}")
+        last.to_image().save(cover_jpg)
+
+
+def center_crop_render_av(
+    input_path: str,
+    output_dir: str,
+    t0: float,
+    t1: float,
+    width: int = 1080,
+    height: int = 1920,
+    fps: int = 30,
+    music_path: Optional[str] = None,
+    music_gain_db: float = -8.0,
+    duck_music: bool = True,
+    hw: Optional[str] = "cuda",
+) -> Tuple[str, str]:
+    """
+    Drop-in for render.center_crop_render that renders in-process with PyAV.
+    Returns (video_path, cover_jpg)
+    """
+    if av is None or music_path or _render._hw_encoder(_render._FFMPEG_BIN, hw):
+        return _render.center_crop_render(
+            input_path, output_dir, t0, t1, width=width, height=height, fps=fps,
+            music_path=music_path, music_gain_db=music_gain_db, duck_music=duck_music, hw=hw,
+        )
+
+    ensure_dir(output_dir)
+    out_mp4 = str(Path(output_dir) / "reel_1080x1920.mp4")
+    cover_jpg = str(Path(output_dir) / "cover.jpg")
+    try:
+        _render_av(input_path, out_mp4, t0, t1, width, height, fps)
+        _extract_cover(out_mp4, cover_jpg)
+    except Exception:
+        logger.exception("PyAV render of %s failed; falling back to ffmpeg", input_path)
+        return _render.center_crop_render(input_path, output_dir, t0, t1, width=width, height=height, fps=fps, hw=hw)
+    return out_mp4, cover_jpg
+
+
+def concat_segments_render_av(
+    segments: List[Segment],
+    output_dir: str,
+    width: int = 1080,
+    height: int = 1920,
+    fps: int = 30,
+    hw: Optional[str] = "cuda",
+) -> Tuple[str, str]:
+    """
+    Drop-in for render.concat_segments_render that encodes every segment into one output in-process.
+    Returns (video_path, cover_jpg)
+    """
+    if av is None or _render._hw_encoder(_render._FFMPEG_BIN, hw):
+        return _render.concat_segments_render(segments, output_dir, width=width, height=height, fps=fps, hw=hw)
+
+    ensure_dir(output_dir)
+    out_mp4 = str(Path(output_dir) / "reel_1080x1920.mp4")
+    cover_jpg = str(Path(output_dir) / "cover.jpg")
+    try:
+        _concat_segments_av(segments, out_mp4, width, height, fps)
+        # Cover from the first segment, which opens the output
+        _extract_cover(out_mp4, cover_jpg, at=0.5)
+    except Exception:
+        logger.exception("PyAV montage of %d segments failed; falling back to ffmpeg", len(segments))
+        return _render.concat_segments_render(segments, output_dir, width=width, height=height, fps=fps, hw=hw)
+    return out_mp4, cover_jpg
@@ -1,9 +1,15 @@
+import dataclasses
 import hashlib
 import json
 import os
 from pathlib import Path
 from typing import Tuple
 
+try:
+    import orjson  # type: ignore
+except Exception:
+    orjson = None  # type: ignore
+
 
 def ensure_dir(path: str | Path) -> None:
     Path(path).mkdir(parents=True, exist_ok=True)
@@ -16,19 +22,40 @@ def hash_video_like(path: str) -> str:
     h = hashlib.sha1()
     p = Path(path)
     h.update(p.name.encode())
+    # Stream the 1MB through one small reused buffer rather than materialising it as bytes
+    buf = bytearray(64 * 1024)
+    view = memoryview(buf)
+    remaining = 1024 * 1024
     try:
-        with open(path, "rb") as f:
-            h.update(f.read(1024 * 1024))
+        with open(path, "rb", buffering=0) as f:
+            while remaining:
+                n = f.readinto(view[: min(len(buf), remaining)])
+                if not n:
+                    break
+                h.update(view[:n])
+                remaining -= n
     except Exception:
         pass
     return h.hexdigest()[:16]
 
 
+def _json_default(obj):
+    if dataclasses.is_dataclass(obj) and not isinstance(obj, type):
+        return dataclasses.asdict(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
 def write_json(path: str | Path, obj) -> str:
+    """Write obj (dataclasses included) as indented JSON; orjson when installed, else stdlib json."""
     path = str(path)
     ensure_dir(Path(path).parent)
-    with open(path, "w", encoding="utf-8") as f:
-        json.dump(obj, f, indent=2)
+    if orjson is not None:
+        # Serializes to bytes in one call, dataclasses natively
+        data = orjson.dumps(obj, option=orjson.OPT_INDENT_2)
+    else:
+        data = json.dumps(obj, indent=2, default=_json_default).encode("utf-8")
+    with open(path, "wb") as f:
+        f.write(data)
     return path
 
 
@@ -1,6 +1,10 @@
 from __future__ import annotations
 
+import functools
+import itertools
 import os
+import re
+import shutil
 import subprocess
 from dataclasses import dataclass
 from pathlib import Path
@@ -9,10 +13,13 @@ from typing import List, Tuple
 from .utils import ensure_dir
 
 
+@functools.lru_cache(maxsize=1)
 def _ffmpeg_bin() -> str:
-    exe = os.environ.get("FFMPEG_BIN")
+    """FFMPEG_BIN if set, else ffmpeg on PATH, else the imageio-ffmpeg bundled binary (resolved once)."""
+    exe = os.environ.get("FFMPEG_BIN") or shutil.which("ffmpeg")
     if exe:
         return exe
+    # Only import imageio_ffmpeg when there's no system ffmpeg to use
     try:
         import imageio_ffmpeg  # type: ignore
         return imageio_ffmpeg.get_ffmpeg_exe()
@@ -20,6 +27,14 @@ def _ffmpeg_bin() -> str:
         return "ffmpeg"
 
 
+# Per-frame motion metrics, cheapest first: scdet logs its own score ("lavfi.scd.score: 0.321"); older
+# ffmpeg builds without scdet fall back to signalstats' luma difference via the metadata filter
+_MOTION_FILTERS = [
+    ("scdet=s=0:t=0", re.compile(rb"lavfi\.scd\.score: ?([0-9.]+)")),
+    ("signalstats,metadata=mode=print:key=lavfi.signalstats.YDIF", re.compile(rb"YDIF[=:]([0-9.]+)")),
+]
+
+
 def _run(cmd: list[str]) -> subprocess.CompletedProcess:
     return subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
 
@@ -40,55 +55,53 @@ def score_motion_segments(
 ) -> List[Segment]:
     """
     Fast motion scoring using ffmpeg filters (no python decode):
-    - downscale
     - fps target_fps
-    - tblend difference between consecutive frames
-    - crop/scale not required here; just aggregate absolute differences
+    - scdet score between consecutive frames (signalstats YDIF on builds without scdet)
+    - crop/scale not required here; just aggregate the per-frame differences
     """
     ff = _ffmpeg_bin()
-    # Compute a simple motion metric using ffmpeg and read framewise power from stderr
-    # We will approximate by decoding frames and calculating frame difference energy via psnr/diff filter.
-    # Simpler: use -vf "fps=10,format=gray,signalstats" and parse YDIF.
-    cmd = [
-        ff,
-        "-hide_banner",
-        "-loglevel",
-        "info",
-        "-i",
-        input_path,
-        "-vf",
-        f"fps={target_fps},format=gray,signalstats",
-        "-f",
-        "null",
-        "-",
-    ]
-    proc = _run(cmd)
-    text = (proc.stderr or proc.stdout).decode("utf-8", errors="ignore")
-
-    # Parse lines containing "Parsed_signalstats" and extract YDIF (difference luma metric)
-    import re
-
+    # Compute a simple per-frame motion metric using ffmpeg and read it from stderr
     diffs: List[float] = []
-    for line in text.splitlines():
-        # e.g., ... signalstats: YDIF:0.0123 ...
-        m = re.search(r"YDIF:([0-9.]+)", line)
-        if m:
+    for motion_vf, metric_re in _MOTION_FILTERS:
+        cmd = [
+            ff,
+            "-hide_banner",
+            "-loglevel",
+            "info",
+            "-i",
+            input_path,
+            # The metric is video-only; don't decode audio
+            "-an",
+            "-vf",
+            f"fps={target_fps},format=gray,{motion_vf}",
+            "-f",
+            "null",
+            "-",
+        ]
+        proc = _run(cmd)
+        if proc.returncode != 0:
+            # Filter missing from this build (or unreadable input); try the next metric
+            continue
+        text = proc.stderr or proc.stdout
+
+        # Extract the metric straight from the raw bytes
+        for m in metric_re.finditer(text):
             try:
                 diffs.append(float(m.group(1)))
             except Exception:
                 pass
+        break
 
     if not diffs:
         return []
 
-    # Build windowed means over per_segment_sec
+    # Build windowed means over per_segment_sec from prefix sums: one pass instead of a sum per window
     hop = 1.0 / target_fps
     win = max(int(round(per_segment_sec / hop)), 1)
-    scores: List[Tuple[int, float]] = []
-    import math
-    for i in range(0, max(0, len(diffs) - win + 1)):
-        s = sum(diffs[i : i + win]) / win
-        scores.append((i, s))
+    cs = [0.0, *itertools.accumulate(diffs)]
+    scores: List[Tuple[int, float]] = [
+        (i, (cs[i + win] - cs[i]) / win) for i in range(0, max(0, len(diffs) - win + 1))
+    ]
 
     # Pick top segments, non-overlapping
     scores.sort(key=lambda x: x[1], reverse=True)
@@ -1,54 +1,38 @@
 import os
-import queue
-import threading
 import time
 import uuid
-from dataclasses import asdict
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from typing import Dict, Optional
 
 from .media import download, download_many, probe
 from .render import center_crop_render, concat_center_crop_render, add_music_overlay, concat_segments_render
+from .render_av import center_crop_render_av, concat_segments_render_av
 from .vision import score_motion_segments, Segment
 from .schemas import Job, JobRequest, ArtifactPaths
 from .utils import ensure_dir, write_json
 
 
 class JobManager:
-    def __init__(self, uploads_root: str):
+    def __init__(self, uploads_root: str, max_workers: Optional[int] = None):
         self.uploads_root = uploads_root
         self.jobs: Dict[str, Job] = {}
-        self.q: "queue.Queue[str]" = queue.Queue()
-        self.thread: Optional[threading.Thread] = None
+        # Jobs spend their time in ffmpeg subprocesses, so a few threads run that many renders side by side
+        self.max_workers = max_workers or int(os.environ.get("REELS_JOB_CONCURRENCY", "2"))
+        # Created up front so concurrent first enqueues can't race to build it; threads start on first submit
+        self.executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="reels-job")
         ensure_dir(self.uploads_root)
 
-    def start(self) -> None:
-        if self.thread and self.thread.is_alive():
-            return
-        self.thread = threading.Thread(target=self._run, daemon=True)
-        self.thread.start()
-
     def enqueue(self, req: JobRequest) -> Job:
         job_id = f"r_{uuid.uuid4().hex[:10]}"
         job = Job(id=job_id, request=req)
         self.jobs[job_id] = job
-        self.q.put(job_id)
+        self.executor.submit(self._process, job)
         return job
 
     def get(self, job_id: str) -> Optional[Job]:
         return self.jobs.get(job_id)
 
-    def _run(self) -> None:
-        while True:
-            try:
-                job_id = self.q.get()
-                job = self.jobs.get(job_id)
-                if not job:
-                    continue
-                self._process(job)
-            except Exception:
-                time.sleep(0.1)
-
     def _process(self, job: Job) -> None:
         job.status = "processing"
         job.updated_at = time.time()
@@ -111,7 +95,7 @@ class JobManager:
                             selected.append(tail)
                     if not selected:
                         selected = cand_segments[:2]
-                    mp4_path, cover_path = concat_segments_render(selected, str(out_dir))
+                    mp4_path, cover_path = concat_segments_render_av(selected, str(out_dir))
 
                 # If music provided, overlay on top with optional music-only
                 if job.request.music_url:
@@ -129,7 +113,7 @@ class JobManager:
                 _ = probe(local_path)
                 t0 = 0.0
                 t1 = max(job.request.target_duration_sec, 3.0)
-                mp4_path, cover_path = center_crop_render(
+                mp4_path, cover_path = center_crop_render_av(
                     input_path=local_path,
                     output_dir=str(out_dir),
                     t0=t0,
@@ -151,12 +135,12 @@ class JobManager:
             job.status = "completed"
             job.updated_at = time.time()
 
-            write_json(Path(out_dir)/"job.json", {"job": asdict(job)})
+            write_json(Path(out_dir)/"job.json", {"job": job})
         except Exception as e:
             job.status = "failed"
             job.error = str(e)
             job.updated_at = time.time()
-            write_json(Path(out_dir)/"job.json", {"job": asdict(job)})
+            write_json(Path(out_dir)/"job.json", {"job": job})
 
 
 job_manager = JobManager(uploads_root=os.environ.get("UPLOADS_ROOT", "uploads"))
@@ -17,9 +17,9 @@ Options:
 import os
 import sys
 import argparse
-import subprocess
 from pathlib import Path
 
+_TRUTHY = frozenset({"true", "1", "yes"})
 
 def load_environment(config_file=".env"):
     """Load environment variables from configuration file"""
@@ -30,11 +30,16 @@ def load_environment(config_file=".env"):
     
     try:
         with open(config_file, 'r') as f:
-            for line in f:
-                line = line.strip()
-                if line and not line.startswith('#') and '=' in line:
-                    key, value = line.split('=', 1)
-                    os.environ[key.strip()] = value.strip()
+            data = f.read()
+        # Parse everything first, then apply in one update
+        parsed = {}
+        for line in data.splitlines():
+            line = line.strip()
+            if not line or line[0] == '#' or '=' not in line:
+                continue
+            key, _, value = line.partition('=')
+            parsed[key.strip()] = value.strip()
+        os.environ.update(parsed)
         print(f"Loaded configuration from: {config_file}")
         return True
     except Exception as e:
@@ -42,6 +47,10 @@ def load_environment(config_file=".env"):
         return False
 
 
+# Certificate check results keyed by (cert path, mtime, size, key path, mtime, size)
+_CERT_CACHE = {}
+
+
 def check_ssl_certificates():
     """Check if SSL certificates exist and are valid"""
     cert_path = os.environ.get("SSL_CERT_PATH", "")
@@ -59,17 +68,25 @@ def check_ssl_certificates():
         print(f"SSL private key not found: {key_path}")
         return False
     
+    # The files only change when rotated, so a previous result holds until their stat does
+    cert_st, key_st = os.stat(cert_path), os.stat(key_path)
+    cache_key = (cert_path, cert_st.st_mtime_ns, cert_st.st_size, key_path, key_st.st_mtime_ns, key_st.st_size)
+    if cache_key in _CERT_CACHE:
+        return _CERT_CACHE[cache_key]
+
     # Check certificate validity
     try:
         import ssl
-        context = ssl.create_default_context()
-        with open(cert_path, 'rb') as f:
-            cert = ssl.PEM_cert_to_DER_cert(f.read())
+        # PEM_cert_to_DER_cert takes the PEM as text
+        with open(cert_path, 'r') as f:
+            ssl.PEM_cert_to_DER_cert(f.read())
         print("SSL certificates are valid")
-        return True
+        ok = True
     except Exception as e:
         print(f"SSL certificate validation failed: {e}")
-        return False
+        ok = False
+    _CERT_CACHE[cache_key] = ok
+    return ok
 
 
 def generate_ssl_certificates():
@@ -96,14 +113,17 @@ def generate_ssl_certificates():
             "--days", "365"
         ]
         
+        import subprocess
+
         print(f"Generating SSL certificates...")
-        result = subprocess.run(cmd, capture_output=True, text=True)
+        # stdout isn't used; stderr is only decoded if generation fails
+        result = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
         
         if result.returncode == 0:
             print("SSL certificates generated successfully")
             return True
         else:
-            print(f"Error generating certificates: {result.stderr}")
+            print(f"Error generating certificates: {result.stderr.decode(errors='replace')}")
             return False
             
     except Exception as e:
@@ -117,18 +137,14 @@ def validate_configuration():
     
     # Check required environment variables
     required_vars = ["SSL_ENABLED"]
-    missing_vars = []
-    
-    for var in required_vars:
-        if not os.environ.get(var):
-            missing_vars.append(var)
+    missing_vars = [var for var in required_vars if not os.environ.get(var)]
     
     if missing_vars:
         print(f"Missing required environment variables: {', '.join(missing_vars)}")
         return False
     
     # Check SSL configuration if enabled
-    if os.environ.get("SSL_ENABLED", "false").lower() in ("true", "1", "yes"):
+    if os.environ.get("SSL_ENABLED", "false").lower() in _TRUTHY:
         if not check_ssl_certificates():
             print("SSL certificate validation failed")
             return False
@@ -143,11 +159,13 @@ def start_server():
         # Import and run the backend
         from backend import app, SSL_ENABLED, SSL_CONTEXT
         
-        host = os.environ.get("HOST", "0.0.0.0")
-        port = int(os.environ.get("PORT", 6741))
-        debug = os.environ.get("DEBUG", "false").lower() in ("true", "1", "yes")
+        env = os.environ
+        host = env.get("HOST", "0.0.0.0")
+        port = int(env.get("PORT", 6741))
+        debug = env.get("DEBUG", "false").lower() in _TRUTHY
+        use_ssl = bool(SSL_ENABLED and SSL_CONTEXT)
         
-        protocol = "HTTPS" if SSL_ENABLED and SSL_CONTEXT else "HTTP"
+        protocol = "HTTPS" if use_ssl else "HTTP"
         
         print(f"\n{'='*50}")
         print(f"Starting Flask Backend Server")
@@ -157,9 +175,9 @@ def start_server():
         print(f"Port: {port}")
         print(f"Debug: {debug}")
         
-        if SSL_ENABLED and SSL_CONTEXT:
-            print(f"SSL Certificate: {os.environ.get('SSL_CERT_PATH')}")
-            print(f"SSL Private Key: {os.environ.get('SSL_KEY_PATH')}")
+        if use_ssl:
+            print(f"SSL Certificate: {env.get('SSL_CERT_PATH')}")
+            print(f"SSL Private Key: {env.get('SSL_KEY_PATH')}")
             print(f"Server URL: https://{host}:{port}")
         else:
             print(f"Server URL: http://{host}:{port}")
@@ -167,7 +185,7 @@ def start_server():
         print(f"{'='*50}\n")
         
         # Start the server
-        if SSL_ENABLED and SSL_CONTEXT:
+        if use_ssl:
             app.run(host=host, port=port, debug=debug, ssl_context=SSL_CONTEXT)
         else:
             app.run(host=host, port=port, debug=debug)
@@ -1,6 +1,10 @@
+import functools
+from pathlib import Path
 from typing import Any, Mapping, Optional
 
-from jinja2 import Environment, BaseLoader, Template, Undefined
+from jinja2 import Environment, BaseLoader, FileSystemBytecodeCache, FileSystemLoader, Template, Undefined
+
+PROMPTS_DIR = Path(__file__).parent / "prompts"
 
 class PreserveUndefined(Undefined):
     """
@@ -18,6 +22,9 @@ class PreserveUndefined(Undefined):
       * Filters/tests called on unknowns will keep the expression unknown.
     """
 
+    # No per-instance __dict__: Undefined already declares the slots we use
+    __slots__ = ()
+
     # --- Helpers -------------------------------------------------------------
 
     def _expr(self) -> str:
@@ -103,8 +110,10 @@ class PreserveUndefined(Undefined):
     __lt__ = __le__ = __gt__ = __ge__ = __eq__ = __ne__ = _op
 
 
+@functools.lru_cache(maxsize=None)
 def _default_env() -> Environment:
-    # BaseLoader since we render strings; keep_trailing_newline for pleasant diffs
+    # BaseLoader since we render strings; keep_trailing_newline for pleasant diffs.
+    # Built once: Environment setup is the same for every call
     return Environment(
         loader=BaseLoader(),
         undefined=PreserveUndefined,
@@ -132,15 +141,61 @@ def partial_render(template_str: str, context: Optional[Mapping[str, Any]] = Non
     str
         The partially-rendered template.
     """
-    env = _default_env()
-    tmpl = env.from_string(template_str)
-    return tmpl.render(**(context or {}))
+    if not context and not any(tok in template_str for tok in ("{{", "{%", "{#")):
+        # Nothing to substitute and no Jinja syntax: rendering is the identity
+        return template_str
+    return _compile(template_str).render(**(context or {}))
+
+
+@functools.lru_cache(maxsize=256)
+def _compile(template_str: str) -> Template:
+    # Lexing/parsing/compiling costs far more than rendering; the same template string
+    # is rendered over and over, so compile it once
+    return _default_env().from_string(template_str)
+
+
+_prompt_env: Optional[Environment] = None
+
+
+def _get_prompt_env() -> Environment:
+    # Loads from prompts/; compiled templates are memoized in-process and their
+    # bytecode is cached on disk so restarts skip compilation too
+    global _prompt_env
+    if _prompt_env is None:
+        _prompt_env = Environment(
+            loader=FileSystemLoader(str(PROMPTS_DIR)),
+            bytecode_cache=FileSystemBytecodeCache(),
+            undefined=PreserveUndefined,
+            autoescape=False,
+            keep_trailing_newline=True,
+        )
+    return _prompt_env
+
+
+def render_prompt(name: str, **context: Any) -> str:
+    """
+    Render a template from the prompts/ directory in a single pass.
+
+    Parameters
+    ----------
+    name : str
+        Template path relative to prompts/, e.g. "template.jinja".
+    **context
+        Values to substitute. Missing variables are preserved as placeholders,
+        as with `partial_render`.
+
+    Returns
+    -------
+    str
+        The rendered template.
+    """
+    return _get_prompt_env().get_template(name).render(**context)
 
 
 if __name__ == "__main__":
     print(partial_render(
-        open('./prompts/template.jinja').read(),
+        Path('./prompts/template.jinja').read_text(),
         {
-            'personality': open('./prompts/alex.md').read()
+            'personality': Path('./prompts/alex.md').read_text()
         }
     ))
\ No newline at end of file
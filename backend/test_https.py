@@ -16,25 +16,68 @@ Options:
     --verbose        Enable verbose output
 """
 
-import requests
 import argparse
-import json
+import io
 import os
-from pathlib import Path
-import ssl
-import urllib3
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 
+# A simple 1x1 PNG image for the upload test
+_TEST_PNG = b'\x89PNG\r\n\x1a\n\x00\x00\x00\rIHDR\x00\x00\x00\x01\x00\x00\x00\x01\x08\x02\x00\x00\x00\x90wS\xde\x00\x00\x00\tpHYs\x00\x00\x0b\x13\x00\x00\x0b\x13\x01\x00\x9a\x9c\x18\x00\x00\x00\nIDATx\x9cc\xf8\x00\x00\x00\x01\x00\x01\x00\x00\x00\x00IEND\xaeB`\x82'
 
-def test_ssl_certificate(url):
+
+class _ThreadOutput:
+    """sys.stdout stand-in that sends each worker thread's prints to its own buffer"""
+
+    def __init__(self, out):
+        self._out = out
+        self._local = threading.local()
+
+    def capture(self):
+        self._local.buf = io.StringIO()
+        return self._local.buf
+
+    def write(self, s):
+        return getattr(self._local, "buf", self._out).write(s)
+
+    def flush(self):
+        self._out.flush()
+
+
+def _requests():
+    """Import requests on first use so --help doesn't pay for it."""
+    import requests
+    return requests
+
+
+def _session(pool_size=1):
+    """One keep-alive session, so the checks reuse its TLS connections"""
+    import urllib3
+    from requests.adapters import HTTPAdapter
+
+    # Disable SSL warnings for self-signed certificates
+    urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
+    session = _requests().Session()
+    session.verify = False
+    session.headers.update({"Connection": "keep-alive"})
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def test_ssl_certificate(url, session=None):
     """Test SSL certificate validity"""
+    requests = _requests()
+    session = session or _session()
     print("Testing SSL certificate...")
     
     try:
-        # Disable SSL warnings for self-signed certificates
-        urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
-        
         # Test SSL connection
-        response = requests.get(url, verify=False, timeout=10)
+        response = session.get(url, timeout=10)
         
         if response.status_code == 200:
             print("✓ SSL certificate is valid and server is accessible")
@@ -54,12 +97,13 @@ def test_ssl_certificate(url):
         return False
 
 
-def test_health_endpoint(url):
+def test_health_endpoint(url, session=None):
     """Test the health check endpoint"""
+    session = session or _session()
     print("Testing health endpoint...")
     
     try:
-        response = requests.get(f"{url}/", verify=False, timeout=10)
+        response = session.get(f"{url}/", timeout=10)
         
         if response.status_code == 200:
             data = response.json()
@@ -74,12 +118,13 @@ def test_health_endpoint(url):
         return False
 
 
-def test_agents_endpoint(url):
+def test_agents_endpoint(url, session=None):
     """Test the agents endpoint"""
+    session = session or _session()
     print("Testing agents endpoint...")
     
     try:
-        response = requests.get(f"{url}/agents", verify=False, timeout=10)
+        response = session.get(f"{url}/agents", timeout=10)
         
         if response.status_code == 200:
             data = response.json()
@@ -95,12 +140,13 @@ def test_agents_endpoint(url):
         return False
 
 
-def test_photos_endpoint(url):
+def test_photos_endpoint(url, session=None):
     """Test the photos listing endpoint"""
+    session = session or _session()
     print("Testing photos endpoint...")
     
     try:
-        response = requests.get(f"{url}/photos", verify=False, timeout=10)
+        response = session.get(f"{url}/photos", timeout=10)
         
         if response.status_code == 200:
             data = response.json()
@@ -116,8 +162,9 @@ def test_photos_endpoint(url):
         return False
 
 
-def test_cors_headers(url):
+def test_cors_headers(url, session=None):
     """Test CORS headers"""
+    session = session or _session()
     print("Testing CORS headers...")
     
     try:
@@ -128,7 +175,7 @@ def test_cors_headers(url):
             'Access-Control-Request-Headers': 'Content-Type'
         }
         
-        response = requests.options(f"{url}/upload", headers=headers, verify=False, timeout=10)
+        response = session.options(f"{url}/upload", headers=headers, timeout=10)
         
         cors_headers = {
             'Access-Control-Allow-Origin': response.headers.get('Access-Control-Allow-Origin'),
@@ -149,27 +196,14 @@ def test_cors_headers(url):
         return False
 
 
-def test_file_upload(url, verbose=False):
+def test_file_upload(url, verbose=False, session=None):
     """Test file upload functionality"""
+    session = session or _session()
     print("Testing file upload...")
     
     try:
-        # Create a test image file
-        test_image_path = Path("test_image.png")
-        
-        # Create a simple 1x1 PNG image for testing
-        png_data = b'\x89PNG\r\n\x1a\n\x00\x00\x00\rIHDR\x00\x00\x00\x01\x00\x00\x00\x01\x08\x02\x00\x00\x00\x90wS\xde\x00\x00\x00\tpHYs\x00\x00\x0b\x13\x00\x00\x0b\x13\x01\x00\x9a\x9c\x18\x00\x00\x00\nIDATx\x9cc\xf8\x00\x00\x00\x01\x00\x01\x00\x00\x00\x00IEND\xaeB`\x82'
-        
-        with open(test_image_path, 'wb') as f:
-            f.write(png_data)
-        
-        # Test upload
-        with open(test_image_path, 'rb') as f:
-            files = {'photo': ('test.png', f, 'image/png')}
-            response = requests.post(f"{url}/upload", files=files, verify=False, timeout=30)
-        
-        # Clean up test file
-        test_image_path.unlink()
+        files = {'photo': ('test.png', _TEST_PNG, 'image/png')}
+        response = session.post(f"{url}/upload", files=files, timeout=30)
         
         if response.status_code == 201:
             data = response.json()
@@ -185,10 +219,6 @@ def test_file_upload(url, verbose=False):
     except Exception as e:
         print(f"✗ File upload error: {e}")
         return False
-    finally:
-        # Clean up test file if it exists
-        if test_image_path.exists():
-            test_image_path.unlink()
 
 
 def run_all_tests(url, verbose=False):
@@ -197,24 +227,42 @@ def run_all_tests(url, verbose=False):
     print("=" * 50)
     
     tests = [
-        ("SSL Certificate", lambda: test_ssl_certificate(url)),
-        ("Health Endpoint", lambda: test_health_endpoint(url)),
-        ("Agents Endpoint", lambda: test_agents_endpoint(url)),
-        ("Photos Endpoint", lambda: test_photos_endpoint(url)),
-        ("CORS Headers", lambda: test_cors_headers(url)),
-        ("File Upload", lambda: test_file_upload(url, verbose)),
+        ("SSL Certificate", test_ssl_certificate),
+        ("Health Endpoint", test_health_endpoint),
+        ("Agents Endpoint", test_agents_endpoint),
+        ("Photos Endpoint", test_photos_endpoint),
+        ("CORS Headers", test_cors_headers),
+        ("File Upload", partial(test_file_upload, verbose=verbose)),
     ]
+    session = _session(pool_size=len(tests))
     
-    results = []
+    # The checks are independent and mostly wait on the network, so run them
+    # concurrently; each one's output is buffered and printed in order
+    stdout = sys.stdout
+    output = _ThreadOutput(stdout)
     
-    for test_name, test_func in tests:
+    def run(test_name, test_func):
+        buf = output.capture()
         print(f"\n{test_name}:")
         try:
-            result = test_func()
-            results.append((test_name, result))
+            result = test_func(url, session=session)
         except Exception as e:
             print(f"✗ {test_name} failed with exception: {e}")
-            results.append((test_name, False))
+            result = False
+        return result, buf.getvalue()
+    
+    sys.stdout = output
+    try:
+        with ThreadPoolExecutor(max_workers=len(tests)) as pool:
+            futures = [pool.submit(run, name, func) for name, func in tests]
+            outcomes = [f.result() for f in futures]
+    finally:
+        sys.stdout = stdout
+    
+    results = []
+    for (test_name, _), (result, text) in zip(tests, outcomes):
+        sys.stdout.write(text)
+        results.append((test_name, result))
     
     # Summary
     print("\n" + "=" * 50)
@@ -1,30 +1,42 @@
 import os
-import shutil
 import tempfile
+from unittest import mock
+
 import pytest
 
 
+def pytest_configure(config):
+    # Known without pytest-xdist installed too; with it, run e.g. `pytest -n auto --dist loadgroup`
+    config.addinivalue_line("markers", "slow: encodes real media with ffmpeg")
+    config.addinivalue_line("markers", "xdist_group(name): keep these tests on one xdist worker")
+
+
 @pytest.fixture()
 def temp_uploads_dir(monkeypatch):
-    tmpdir = tempfile.mkdtemp(prefix="uploads_")
-    # Ensure nested dirs used by backend exist
-    os.makedirs(os.path.join(tmpdir, "cleaned"), exist_ok=True)
-    os.makedirs(os.path.join(tmpdir, "edited"), exist_ok=True)
-    monkeypatch.setenv("GCP_PROJECT", os.environ.get("GCP_PROJECT", "test-project"))
-    yield tmpdir
-    shutil.rmtree(tmpdir, ignore_errors=True)
+    # tmpfs where available so uploads never touch the disk
+    base = "/dev/shm" if os.path.isdir("/dev/shm") else None
+    with tempfile.TemporaryDirectory(prefix="uploads_", dir=base, ignore_cleanup_errors=True) as tmpdir:
+        # Ensure nested dirs used by backend exist
+        os.makedirs(os.path.join(tmpdir, "cleaned"))
+        os.makedirs(os.path.join(tmpdir, "edited"))
+        monkeypatch.setenv("GCP_PROJECT", os.environ.get("GCP_PROJECT", "test-project"))
+        yield tmpdir
 
 
-@pytest.fixture()
-def app_client(temp_uploads_dir):
-    # Import after env is set
-    import backend
+@pytest.fixture(scope="session")
+def _backend():
+    # Imported once per session: the first import of backend is the expensive part.
+    # It reads GCP_PROJECT at import time, before any per-test monkeypatch runs
+    # Restored on teardown so the default doesn't outlive the session
+    with mock.patch.dict(os.environ, {"GCP_PROJECT": os.environ.get("GCP_PROJECT", "test-project")}):
+        import backend
 
-    backend.app.config.update({
-        "TESTING": True,
-        "UPLOAD_FOLDER": temp_uploads_dir,
-    })
-    client = backend.app.test_client()
-    return client
+        backend.app.config["TESTING"] = True
+        yield backend
 
 
+@pytest.fixture()
+def app_client(_backend, temp_uploads_dir):
+    # UPLOAD_FOLDER stays per-test so uploads don't leak between tests
+    _backend.app.config["UPLOAD_FOLDER"] = temp_uploads_dir
+    return _backend.app.test_client()
@@ -1,7 +1,12 @@
 #!/usr/bin/env python3
 # run.py
+import atexit
+import functools
 import os
+import random
 import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
 from pathlib import Path
 from typing import Optional, Dict, Any, List, Tuple, Union
 
@@ -35,7 +40,7 @@ CAROUSEL_ITEMS: Optional[List[Tuple[str, str]]] = [
 try:
     from dotenv import load_dotenv, find_dotenv  # pip install python-dotenv
 except ImportError:
-    raise SystemExit("Please: pip install python-dotenv httpx")
+    raise SystemExit("Please: pip install python-dotenv 'httpx[http2]'")
 
 env_loaded = load_dotenv(dotenv_path=Path(__file__).with_name(".env"))
 if not env_loaded:
@@ -44,6 +49,31 @@ if not env_loaded:
 import httpx
 
 API_VERSION = os.getenv("API_VERSION", "v23.0")
+GRAPH_URL = f"https://graph.facebook.com/{API_VERSION}"
+
+try:
+    import h2  # noqa: F401  (httpx needs it for http2=True)
+    _HTTP2 = True
+except ImportError:
+    _HTTP2 = False
+
+try:
+    from orjson import loads as _json_loads
+except ImportError:
+    from json import loads as _json_loads
+
+
+@functools.lru_cache(maxsize=None)
+def _client() -> httpx.Client:
+    """One pooled client for every Graph API call, so connections to graph.facebook.com are reused."""
+    client = httpx.Client(
+        timeout=60,
+        follow_redirects=True,
+        http2=_HTTP2,
+        limits=httpx.Limits(max_keepalive_connections=8, keepalive_expiry=300),
+    )
+    atexit.register(client.close)
+    return client
 
 
 # =======================
@@ -55,21 +85,40 @@ def _need(name: str) -> str:
         raise ValueError(f"{name} is required (set it in .env or env)")
     return v
 
+@dataclass(frozen=True)
+class _IGConfig:
+    ig_user_id: str
+    page_token: str
+    media_url: str    # POST: create a container
+    publish_url: str  # POST: publish a container
+
+@functools.lru_cache(maxsize=1)
+def _cfg() -> _IGConfig:
+    """Credentials from .env/env, validated once per process."""
+    ig_user_id = _need("IG_USER_ID")
+    return _IGConfig(
+        ig_user_id=ig_user_id,
+        page_token=_need("PAGE_TOKEN"),
+        media_url=f"{GRAPH_URL}/{ig_user_id}/media",
+        publish_url=f"{GRAPH_URL}/{ig_user_id}/media_publish",
+    )
+
 def _api_ok(resp: httpx.Response, ctx: str) -> Dict[str, Any]:
-    t = resp.text
     try:
         resp.raise_for_status()
-        return resp.json()
+        return _json_loads(resp.content)
     except Exception as e:
-        raise RuntimeError(f"{ctx} | HTTP {resp.status_code} | body: {t}") from e
+        # Only decode the body as text when reporting an error
+        raise RuntimeError(f"{ctx} | HTTP {resp.status_code} | body: {resp.text}") from e
 
 def _wait_ready(client: httpx.Client, container_id: str, page_token: str,
-                timeout_s: int = 300, poll_s: int = 5) -> None:
-    """Poll a media container until status_code == FINISHED."""
-    url = f"https://graph.facebook.com/{API_VERSION}/{container_id}"
+                timeout_s: int = 300, initial: float = 1.0, cap: float = 10.0) -> None:
+    """Poll a media container until status_code == FINISHED, backing off from `initial` to `cap` seconds."""
+    url = f"{GRAPH_URL}/{container_id}"
     params = {"fields": "status_code,status", "access_token": page_token}
     start = time.time()
     last = None
+    attempt = 0
     while True:
         r = client.get(url, params=params)
         j = _api_ok(r, "Check container status failed")
@@ -84,7 +133,19 @@ def _wait_ready(client: httpx.Client, container_id: str, page_token: str,
             raise RuntimeError(f"Container processing failed: {j}")
         if time.time() - start > timeout_s:
             raise TimeoutError(f"Timed out waiting for container to be ready (last={j})")
-        time.sleep(poll_s)
+        # Short clips finish fast; long ones don't need polling every few seconds
+        time.sleep(min(cap, initial * (1.5 ** attempt)) + random.uniform(0, 0.25))
+        attempt += 1
+
+
+def _permalink(client: httpx.Client, media_id: Optional[str], page_token: str) -> Optional[str]:
+    """Best-effort permalink lookup for published media (one extra GET; None on failure)."""
+    try:
+        r = client.get(f"{GRAPH_URL}/{media_id}", params={"fields": "permalink", "access_token": page_token})
+        r.raise_for_status()
+        return _json_loads(r.content).get("permalink")
+    except Exception:
+        return None
 
 
 # =======================
@@ -96,12 +157,13 @@ def publish_single(
     media_kind: str,     # "img" | "video"
     url: str,
     caption: Optional[str] = None,
+    with_permalink: Optional[bool] = None,
 ) -> Dict[str, Any]:
     """Publish a single IMAGE (feed) or STORY (image or video)."""
-    ig_user_id = _need("IG_USER_ID")
-    page_token = _need("PAGE_TOKEN")
+    cfg = _cfg()
+    page_token = cfg.page_token
 
-    create_url = f"https://graph.facebook.com/{API_VERSION}/{ig_user_id}/media"
+    create_url = cfg.media_url
     data: Dict[str, str] = {"access_token": page_token}
 
     if is_story:
@@ -121,38 +183,31 @@ def publish_single(
         if caption:
             data["caption"] = caption
 
-    with httpx.Client(timeout=60, follow_redirects=True) as client:
-        # 1) Create container
-        r = client.post(create_url, data=data)
-        j = _api_ok(r, "Create media container failed")
-        container_id = j.get("id") or ""
-        print(f"Create response: {j}")
-
-        # 2) If it's a Story VIDEO, wait until processed before publishing
-        if is_story and media_kind == "video":
-            _wait_ready(client, container_id, page_token, timeout_s=300, poll_s=5)
-            time.sleep(2)  # small grace
-
-        # 3) Publish
-        r = client.post(
-            f"https://graph.facebook.com/{API_VERSION}/{ig_user_id}/media_publish",
-            data={"creation_id": container_id, "access_token": page_token},
-        )
-        print("Publish response:", r.text)
-        pub = _api_ok(r, "Publish failed")
-        media_id = pub.get("id")
-
-        # 4) Permalink (stories generally won't have one)
-        permalink = None
-        try:
-            r = client.get(
-                f"https://graph.facebook.com/{API_VERSION}/{media_id}",
-                params={"fields": "id,permalink,media_type,timestamp", "access_token": page_token},
-            )
-            r.raise_for_status()
-            permalink = r.json().get("permalink")
-        except Exception:
-            pass
+    client = _client()
+    # 1) Create container
+    r = client.post(create_url, data=data)
+    j = _api_ok(r, "Create media container failed")
+    container_id = j.get("id") or ""
+    print(f"Create response: {j}")
+
+    # 2) If it's a Story VIDEO, wait until processed before publishing
+    if is_story and media_kind == "video":
+        _wait_ready(client, container_id, page_token, timeout_s=300)
+        time.sleep(2)  # small grace
+
+    # 3) Publish
+    r = client.post(
+        cfg.publish_url,
+        data={"creation_id": container_id, "access_token": page_token},
+    )
+    print("Publish response:", r.text)
+    pub = _api_ok(r, "Publish failed")
+    media_id = pub.get("id")
+
+    # 4) Permalink (stories generally won't have one, so they skip the lookup by default)
+    if with_permalink is None:
+        with_permalink = not is_story
+    permalink = _permalink(client, media_id, page_token) if with_permalink else None
 
     return {"media_id": media_id, "permalink": permalink, "container_id": container_id}
 
@@ -163,10 +218,11 @@ def publish_video_or_reel(
     reel: bool,
     share_to_feed: bool = True,
     thumb_offset_ms: Optional[int] = None,
+    with_permalink: bool = True,
 ) -> Dict[str, Any]:
     """Publish a feed VIDEO or a REEL (waits for processing)."""
-    ig_user_id = _need("IG_USER_ID")
-    page_token = _need("PAGE_TOKEN")
+    cfg = _cfg()
+    page_token = cfg.page_token
 
     data: Dict[str, str] = {
         "access_token": page_token,
@@ -180,119 +236,105 @@ def publish_video_or_reel(
     if thumb_offset_ms is not None:
         data["thumb_offset"] = str(thumb_offset_ms)
 
-    with httpx.Client(timeout=60, follow_redirects=True) as client:
-        # 1) Create container
-        r = client.post(f"https://graph.facebook.com/{API_VERSION}/{ig_user_id}/media", data=data)
-        j = _api_ok(r, "Create video container failed")
-        container_id = j.get("id") or ""
-        print(f"Create response: {j}")
-
-        # 2) Wait for processing
-        _wait_ready(client, container_id, page_token, timeout_s=300, poll_s=5)
-
-        # 3) Publish
-        r = client.post(
-            f"https://graph.facebook.com/{API_VERSION}/{ig_user_id}/media_publish",
-            data={"creation_id": container_id, "access_token": page_token},
-        )
-        print("Publish response:", r.text)
-        pub = _api_ok(r, "Publish failed")
-        media_id = pub.get("id")
-
-        # 4) Permalink
-        permalink = None
-        try:
-            r = client.get(
-                f"https://graph.facebook.com/{API_VERSION}/{media_id}",
-                params={"fields": "id,permalink,media_type,caption,timestamp", "access_token": page_token},
-            )
-            r.raise_for_status()
-            permalink = r.json().get("permalink")
-        except Exception:
-            pass
+    client = _client()
+    # 1) Create container
+    r = client.post(cfg.media_url, data=data)
+    j = _api_ok(r, "Create video container failed")
+    container_id = j.get("id") or ""
+    print(f"Create response: {j}")
+
+    # 2) Wait for processing
+    _wait_ready(client, container_id, page_token, timeout_s=300)
+
+    # 3) Publish
+    r = client.post(
+        cfg.publish_url,
+        data={"creation_id": container_id, "access_token": page_token},
+    )
+    print("Publish response:", r.text)
+    pub = _api_ok(r, "Publish failed")
+    media_id = pub.get("id")
+
+    # 4) Permalink
+    permalink = _permalink(client, media_id, page_token) if with_permalink else None
 
     return {"media_id": media_id, "permalink": permalink, "container_id": container_id}
 
 def publish_carousel_items(
     items: List[Tuple[str, str]],  # [("img","https://..."), ("video","https://...")]
     caption: Optional[str] = None,
+    with_permalink: bool = True,
 ) -> Dict[str, Any]:
     """Publish an image/video (or mixed) carousel (2–10 items). Waits for video children to finish."""
-    ig_user_id = _need("IG_USER_ID")
-    page_token = _need("PAGE_TOKEN")
+    cfg = _cfg()
+    page_token = cfg.page_token
     if not (2 <= len(items) <= 10):
         raise ValueError("Carousel requires 2–10 items.")
 
-    with httpx.Client(timeout=60, follow_redirects=True) as client:
-        child_ids: List[str] = []
+    client = _client()
 
-        # 1) Create children
-        for kind, url in items:
-            kind_l = kind.strip().lower()
-            data: Dict[str, str] = {"access_token": page_token, "is_carousel_item": "true"}
+    def _create_child(kind_l: str, url: str) -> str:
+        data: Dict[str, str] = {"access_token": page_token, "is_carousel_item": "true"}
 
-            if kind_l == "video":
-                # 🔧 critical: some API versions require media_type=VIDEO for video children
-                data.update({"media_type": "VIDEO", "video_url": url})
-            elif kind_l == "img":
-                data["image_url"] = url
-            else:
-                raise ValueError("Each item kind must be 'img' or 'video'.")
-
-            # (optional) quick debug
-            # print("DEBUG child payload:", data)
-
-            r = client.post(f"https://graph.facebook.com/{API_VERSION}/{ig_user_id}/media", data=data)
-            j = _api_ok(r, "Create child failed")
-            cid = j.get("id")
-            if not cid:
-                raise RuntimeError(f"Child create returned no id: {j}")
-            print(f"Child created: {cid} ({kind_l})")
-
-            # Videos need processing; wait until FINISHED
-            if kind_l == "video":
-                _wait_ready(client, cid, page_token, timeout_s=300, poll_s=5)
-
-            child_ids.append(cid)
-
-        # 2) Create parent
-        payload: Dict[str, str] = {
-            "media_type": "CAROUSEL",
-            "children": ",".join(child_ids),
-            "access_token": page_token,
-        }
-        if caption:
-            payload["caption"] = caption
-
-        r = client.post(f"https://graph.facebook.com/{API_VERSION}/{ig_user_id}/media", data=payload)
-        parent = _api_ok(r, "Parent carousel create failed")
-        parent_id = parent.get("id")
-        if not parent_id:
-            raise RuntimeError(f"Parent create returned no id: {parent}")
-        print(f"Parent container: {parent_id}")
-
-        # 3) Publish
-        r = client.post(
-            f"https://graph.facebook.com/{API_VERSION}/{ig_user_id}/media_publish",
-            data={"creation_id": parent_id, "access_token": page_token},
-        )
-        print("Publish response:", r.text)
-        pub = _api_ok(r, "Publish failed")
-        media_id = pub.get("id")
-        if not media_id:
-            raise RuntimeError(f"Publish returned no id: {pub}")
-
-        # 4) Permalink (best-effort)
-        permalink = None
-        try:
-            r = client.get(
-                f"https://graph.facebook.com/{API_VERSION}/{media_id}",
-                params={"fields": "id,permalink,media_type,caption,timestamp", "access_token": page_token},
-            )
-            r.raise_for_status()
-            permalink = r.json().get("permalink")
-        except Exception:
-            pass
+        if kind_l == "video":
+            # 🔧 critical: some API versions require media_type=VIDEO for video children
+            data.update({"media_type": "VIDEO", "video_url": url})
+        else:
+            data["image_url"] = url
+
+        # (optional) quick debug
+        # print("DEBUG child payload:", data)
+
+        r = client.post(cfg.media_url, data=data)
+        j = _api_ok(r, "Create child failed")
+        cid = j.get("id")
+        if not cid:
+            raise RuntimeError(f"Child create returned no id: {j}")
+        print(f"Child created: {cid} ({kind_l})")
+
+        # Videos need processing; wait until FINISHED
+        if kind_l == "video":
+            _wait_ready(client, cid, page_token, timeout_s=300)
+        return cid
+
+    kinds = [kind.strip().lower() for kind, _ in items]
+    if any(k not in ("img", "video") for k in kinds):
+        raise ValueError("Each item kind must be 'img' or 'video'.")
+
+    # 1) Create children concurrently: each is independent until the parent is assembled,
+    # so the wait is the slowest video's processing time rather than the sum
+    with ThreadPoolExecutor(max_workers=len(items)) as ex:
+        child_ids: List[str] = list(ex.map(_create_child, kinds, [url for _, url in items]))
+
+    # 2) Create parent
+    payload: Dict[str, str] = {
+        "media_type": "CAROUSEL",
+        "children": ",".join(child_ids),
+        "access_token": page_token,
+    }
+    if caption:
+        payload["caption"] = caption
+
+    r = client.post(cfg.media_url, data=payload)
+    parent = _api_ok(r, "Parent carousel create failed")
+    parent_id = parent.get("id")
+    if not parent_id:
+        raise RuntimeError(f"Parent create returned no id: {parent}")
+    print(f"Parent container: {parent_id}")
+
+    # 3) Publish
+    r = client.post(
+        cfg.publish_url,
+        data={"creation_id": parent_id, "access_token": page_token},
+    )
+    print("Publish response:", r.text)
+    pub = _api_ok(r, "Publish failed")
+    media_id = pub.get("id")
+    if not media_id:
+        raise RuntimeError(f"Publish returned no id: {pub}")
+
+    # 4) Permalink (best-effort)
+    permalink = _permalink(client, media_id, page_token) if with_permalink else None
 
     return {"published_id": media_id, "permalink": permalink, "parent_container_id": parent_id, "child_ids": child_ids}
 
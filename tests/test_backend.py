@@ -1,14 +1,19 @@
+import functools
 import io
 import os
 from PIL import Image
 
 
-def _make_image_bytes(color=(255, 0, 0), size=(64, 64)):
+@functools.lru_cache(maxsize=None)
+def _encode_image(color, size):
+    # JPEG-encode each (color, size) once per session
     buf = io.BytesIO()
-    img = Image.new("RGB", size, color)
-    img.save(buf, format="JPEG")
-    buf.seek(0)
-    return buf
+    Image.new("RGB", size, color).save(buf, format="JPEG")
+    return buf.getvalue()
+
+
+def _make_image_bytes(color=(255, 0, 0), size=(64, 64)):
+    return io.BytesIO(_encode_image(color, size))
 
 
 def test_health_check(app_client):
@@ -4,6 +4,9 @@ from pathlib import Path
 
 import pytest
 
+# ffmpeg-heavy: under xdist (--dist loadgroup) these share one worker and its session media
+pytestmark = [pytest.mark.slow, pytest.mark.xdist_group("ffmpeg")]
+
 
 def _ffmpeg_bin():
     try:
@@ -26,58 +29,154 @@ def _gen_test_video(path: str, duration: float = 5.0, size: str = "1280x720", fp
     cmd = [ff, "-y", "-nostdin", "-hide_banner", "-loglevel", "error", "-f", "lavfi", "-i", vf]
     if with_audio:
         cmd += ["-f", "lavfi", "-i", f"sine=frequency=440:duration={duration}"]
-    cmd += ["-t", f"{duration:.3f}", "-c:v", "libx264", "-crf", "20", "-pix_fmt", "yuv420p"]
+    # Throwaway fixture: any valid H.264 will do, so encode as cheaply as possible
+    cmd += ["-t", f"{duration:.3f}", "-c:v", "libx264", "-preset", "ultrafast", "-tune", "zerolatency",
+            "-g", str(fps), "-crf", "28", "-pix_fmt", "yuv420p"]
     if with_audio:
         cmd += ["-c:a", "aac", "-ar", "48000", "-ac", "2"]
-    cmd += [path]
+    # Single-threaded so parallel test workers, not ffmpeg, decide CPU usage
+    cmd += ["-threads", "1", path]
     _run(cmd)
 
 
 def _gen_test_music(path: str, duration: float = 8.0) -> None:
     ff = _ffmpeg_bin()
-    cmd = [ff, "-y", "-nostdin", "-hide_banner", "-loglevel", "error", "-f", "lavfi", "-i", f"sine=frequency=220:duration={duration}", "-c:a", "aac", "-ar", "48000", "-ac", "2", path]
+    cmd = [ff, "-y", "-nostdin", "-hide_banner", "-loglevel", "error", "-f", "lavfi", "-i", f"sine=frequency=220:duration={duration}", "-c:a", "aac", "-b:a", "64k", "-ar", "48000", "-ac", "2", "-threads", "1", path]
     _run(cmd)
 
 
-def test_concat_then_music_overlay_smoke():
+@pytest.fixture(scope="session")
+def test_video(tmp_path_factory):
+    # Generated once per session; renders only read it
+    path = str(tmp_path_factory.mktemp("reels_media") / "v1.mp4")
+    _gen_test_video(path, duration=6.0)
+    return path
+
+
+@pytest.fixture(scope="session")
+def test_music(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("reels_media") / "music.m4a")
+    _gen_test_music(path, duration=10.0)
+    return path
+
+
+def test_concat_then_music_overlay_smoke(test_video, test_music):
     try:
         from backend.reels_engine.render import concat_center_crop_render, add_music_overlay
     except Exception as e:
         pytest.skip(f"render import failed: {e}")
 
     with tempfile.TemporaryDirectory() as td:
-        v1 = str(Path(td) / "v1.mp4")
-        v2 = str(Path(td) / "v2.mp4")
-        music = str(Path(td) / "music.m4a")
+        music = test_music
         out_dir = str(Path(td) / "out")
 
-        _gen_test_video(v1, duration=4.0)
-        _gen_test_video(v2, duration=4.0)
-        _gen_test_music(music, duration=10.0)
-
-        mp4, cover = concat_center_crop_render([v1, v2], out_dir, crossfade_sec=None, per_segment_sec=3.0)
+        mp4, cover = concat_center_crop_render([test_video, test_video], out_dir, crossfade_sec=None, per_segment_sec=3.0)
         assert os.path.exists(mp4) and os.path.getsize(mp4) > 100_000
         final = add_music_overlay(mp4, out_dir, music_path=music, music_gain_db=-6.0, duck_music=True, music_only=True)
         # File size may vary due to container overhead; just assert it's reasonably large
         assert os.path.exists(final) and os.path.getsize(final) > 50_000
 
 
-def test_single_center_crop_with_music():
+def test_single_center_crop_with_music(test_video, test_music):
     try:
         from backend.reels_engine.render import center_crop_render
     except Exception as e:
         pytest.skip(f"render import failed: {e}")
 
     with tempfile.TemporaryDirectory() as td:
-        v1 = str(Path(td) / "v1.mp4")
-        music = str(Path(td) / "music.m4a")
+        music = test_music
         out_dir = str(Path(td) / "out")
 
-        _gen_test_video(v1, duration=6.0)
-        _gen_test_music(music, duration=8.0)
-
-        mp4, cover = center_crop_render(v1, out_dir, t0=0.0, t1=5.0, music_path=music, music_gain_db=-8.0, duck_music=True)
+        mp4, cover = center_crop_render(test_video, out_dir, t0=0.0, t1=5.0, music_path=music, music_gain_db=-8.0, duck_music=True)
         assert os.path.exists(mp4) and os.path.getsize(mp4) > 100_000
         assert os.path.exists(cover)
 
 
+def _av_stream_info(path: str):
+    import av  # type: ignore
+    with av.open(path) as c:
+        v = c.streams.video[0]
+        return (v.codec_context.width, v.codec_context.height), len(c.streams.audio), c.duration / 1e6
+
+
+def test_render_av_trim_smoke(test_video):
+    pytest.importorskip("av")
+    from backend.reels_engine.render_av import _render_av
+
+    with tempfile.TemporaryDirectory() as td:
+        out = str(Path(td) / "clip.mp4")
+        _render_av(test_video, out, 1.0, 3.0, 1080, 1920, 30)
+        size, n_audio, duration = _av_stream_info(out)
+        assert size == (1080, 1920)
+        assert n_audio == 1
+        assert 1.8 <= duration <= 2.3
+
+
+def test_concat_segments_av_smoke(test_video):
+    pytest.importorskip("av")
+    from backend.reels_engine.render_av import _concat_segments_av
+    from backend.reels_engine.vision import Segment
+
+    segments = [Segment(test_video, 0.0, 1.5, 1.0), Segment(test_video, 3.0, 4.5, 0.5)]
+    with tempfile.TemporaryDirectory() as td:
+        out = str(Path(td) / "montage.mp4")
+        _concat_segments_av(segments, out, 1080, 1920, 30)
+        size, n_audio, duration = _av_stream_info(out)
+        assert size == (1080, 1920)
+        assert n_audio == 1
+        assert 2.7 <= duration <= 3.4
+
+
+def test_hw_fallback_only_on_device_errors(monkeypatch):
+    from backend.reels_engine import render
+
+    calls = []
+    errors = {}
+
+    def fake_run(cmd):
+        calls.append(cmd[0])
+        if cmd[0] in errors:
+            raise RuntimeError(errors[cmd[0]])
+
+    monkeypatch.setattr(render, "_run_ffmpeg", fake_run)
+    monkeypatch.setattr(render, "_hw_failed", False)
+    build = lambda gpu: ["gpu" if gpu else "cpu"]
+
+    # Input/filtergraph errors are raised as is: no CPU rerun, hardware stays enabled
+    errors["gpu"] = "Stream specifier ':a' matches no streams"
+    with pytest.raises(RuntimeError):
+        render._run_ffmpeg_hw(build, True)
+    assert calls == ["gpu"] and not render._hw_failed
+
+    # Device errors retry on CPU and turn hardware off for later renders
+    calls.clear()
+    errors["gpu"] = "OpenEncodeSessionEx failed: no capable devices found (h264_nvenc)"
+    render._run_ffmpeg_hw(build, True)
+    assert calls == ["gpu", "cpu"] and render._hw_failed
+
+
+def test_av_wrappers_defer_to_hardware_encoder(monkeypatch):
+    from backend.reels_engine import render, render_av
+
+    if render_av.av is None:
+        monkeypatch.setattr(render_av, "av", object())
+    monkeypatch.setattr(render, "_detect_hw_encoder", lambda ffmpeg_bin: "h264_nvenc")
+    monkeypatch.setattr(render, "_hw_failed", False)
+    calls = []
+    monkeypatch.setattr(render, "center_crop_render", lambda *a, **kw: calls.append(("crop", kw["hw"])) or ("v", "c"))
+    monkeypatch.setattr(render, "concat_segments_render", lambda *a, **kw: calls.append(("concat", kw["hw"])) or ("v", "c"))
+    monkeypatch.setattr(render_av, "_render_av", lambda *a: calls.append("av"))
+    monkeypatch.setattr(render_av, "_concat_segments_av", lambda *a: calls.append("av"))
+    monkeypatch.setattr(render_av, "_extract_cover", lambda *a, **kw: None)
+
+    with tempfile.TemporaryDirectory() as td:
+        # A hardware encoder is available: the subprocess renderer gets the job, hw included
+        render_av.center_crop_render_av("in.mp4", td, 0.0, 3.0, hw="cuda")
+        render_av.concat_segments_render_av([], td, hw="cuda")
+        assert calls == [("crop", "cuda"), ("concat", "cuda")]
+
+        # hw=None keeps the in-process libx264 path
+        calls.clear()
+        render_av.center_crop_render_av("in.mp4", td, 0.0, 3.0, hw=None)
+        render_av.concat_segments_render_av([], td, hw=None)
+        assert calls == ["av", "av"]